@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 from pathlib import Path
 
@@ -40,11 +41,19 @@ if TEST_RUN:
     # A small 500m x 500m patch for testing logic
     # Coordinates in EPSG:3857 (Web Mercator)
     BOUNDS_STR = "([-13100000, -13095000],[3980000, 3985000])"
-    print("--- RUNNING IN TEST MODE (Small Area) ---")
+    # Main process only: spawned worker processes re-import this module
+    if multiprocessing.current_process().name == "MainProcess":
+        print("--- RUNNING IN TEST MODE (Small Area) ---")
 else:
     # The full study area bounds
     BOUNDS_STR = "([-13035749.581531966,-12973917.047710635],[4018953.87470956,4080431.0491411127])"
 
+# Optional study area polygon (GeoJSON, shapefile, or any format geopandas
+# reads; reprojected to EPSG:3857). When set it replaces BOUNDS_STR: tiles
+# are laid out over its extent, tiles outside it are skipped, and EPT nodes
+# and points outside it are never downloaded.
+AOI_PATH = None
+
 # --- DOWNLOAD PARAMETERS ---
 # Enter your download tile size in meters
 TILE_SIZE = 5000
@@ -52,11 +61,147 @@ TILE_SIZE = 5000
 # Enter the amount of overlap between tiles in meters
 OVERLAP = 2000
 
+# Tile layout:
+#   "grid"     — TILE_SIZE squares overlapping by OVERLAP
+#   "balanced" — tiles sized from EPT hierarchy point counts so that each
+#                holds about TILE_TARGET_POINTS points: dense areas are split
+#                into smaller tiles and sparse areas merged into larger ones
+#                (cores TILE_SIZE_MIN to TILE_SIZE_MAX on a side), still
+#                overlapping their neighbours by OVERLAP
+TILING = "grid"
+
+# Points per balanced tile core, as counted in the EPT hierarchy down to RES
+# (all classes; ground points scale with it). None = the average core of a
+# TILE_SIZE grid tile, so the tile count stays about the same.
+TILE_TARGET_POINTS = None
+TILE_SIZE_MIN = 1000
+TILE_SIZE_MAX = 20000
+
+# Tile layout with estimated point counts, written by batchdownload.py and
+# reused while the settings above are unchanged. Later stages read it to
+# weight their progress ETAs by tile size.
+TILE_PLAN = DATA_RAW / "tile_plan.json"
+
 # Enter the LiDAR resolution you'd like to download in meters
+# (target point spacing). EPT octree depths finer than this are not
+# downloaded. Set to None to download the full-density point cloud.
 RES = 2.0
 
+# Number of EPT node requests in flight at the start of a run
+# (all requests share one pooled HTTP session)
+DOWNLOAD_CONCURRENCY = 8
+
+# The in-flight count then adapts (AIMD): it grows by one per round of
+# successful requests up to DOWNLOAD_CONCURRENCY_MAX, is halved when S3
+# throttles (503 SlowDown, 429) or connections fail, and backs off when
+# response latency climbs well above its baseline (by at least 50 ms, so
+# jitter on a fast link is ignored).
+# Set equal to DOWNLOAD_CONCURRENCY to never exceed the starting count.
+DOWNLOAD_CONCURRENCY_MAX = 32
+
+# Optional cap on total download bandwidth, in Mbit/s across all requests,
+# so a workstation stays usable during a long pull. 0 = unlimited.
+DOWNLOAD_BANDWIDTH_MBPS = 0
+
+# Worker processes decompressing LAZ nodes while downloads continue.
+# Filtered ground points are handed back through shared memory.
+# Set to 0 to decode on the main process instead.
+DECODE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Point attributes decoded from EPT nodes and written to the ground tiles:
+#   "all"  — every attribute, as stored in the EPT dataset
+#   "xyzc" — X, Y, Z and classification (plus return numbers) only, which
+#            is all the DEM stage uses. LAZ 1.4 nodes (point formats 6+)
+#            are decompressed selectively, skipping intensity, GPS time,
+#            RGB, etc. Tiles are written in point format 0 (6 for LAS 1.4
+#            sources), so colour, NIR and waveform fields are dropped; the
+#            fields every format carries (intensity, point source ID, ...)
+#            hold zeros and are listed in a "ksn-project" VLR in each tile.
+DOWNLOAD_DIMENSIONS = "all"
+
+# On-disk cache for ept.json and ept-hierarchy pages. Entries are revalidated
+# once per run with ETag/Last-Modified, then served from memory for all tiles.
+EPT_CACHE_DIR = DATA_SCRATCH / "ept_cache"
+
+# Local EPT mirror written by mirror_ept.py. Set EPT_URL to the mirror's
+# ept.json (a plain path or file:// URL) to re-tile without the network.
+EPT_MIRROR_DIR = DATA_SCRATCH / "ept_mirror"
+
+# On-disk cache of downloaded EPT node files, so nodes shared by overlapping
+# tiles are fetched from S3 only once. Least recently used nodes are evicted
+# when the cache grows past the cap. Set to 0 to disable the node cache.
+NODE_CACHE_DIR = EPT_CACHE_DIR / "nodes"
+NODE_CACHE_MAX_GB = 50
+
+# Transient HTTP failures (connection resets, timeouts, 429/5xx) are retried
+# with exponential backoff and jitter: the n-th retry waits a random time of
+# up to RETRY_BACKOFF_S * 2**n seconds.
+DOWNLOAD_RETRIES = 5
+RETRY_BACKOFF_S = 1.0
+
+# Output format for downloaded ground tiles:
+#   "laz"  — plain LAZ
+#   "copc" — Cloud Optimized Point Cloud (LAZ 1.4 with an octree index), so
+#            later stages can read spatial windows or coarse levels without
+#            decompressing the whole tile. Still readable as ordinary LAZ.
+OUTPUT_FORMAT = "laz"
+
+# Download strategy:
+#   "tile" — fetch the nodes of each tile in turn (nodes shared by
+#            overlapping tiles are reused through the node cache)
+#   "node" — plan every node for the study area up front, fetch each node
+#            exactly once, and route its ground points into every tile
+#            (core plus overlap) it contributes to
+DOWNLOAD_MODE = "tile"
+
+# Job ledger recording each tile's node list and per-node progress, so an
+# interrupted download resumes without re-fetching completed nodes
+DOWNLOAD_LEDGER = DATA_RAW / "download_ledger.jsonl"
+
+# Tile mode only (node mode always spools):
+#   False — each tile's ground points are streamed straight into the
+#           compressed writer. An interrupted tile is fetched again, from
+#           the node cache for the nodes it already had.
+#   True  — every node's points are first spooled to an uncompressed part
+#           under DATA_RAW/.partial, so an interrupted tile resumes node by
+#           node, at the cost of writing, re-reading and compressing each
+#           tile's points a second time.
+# A tile left with spooled progress by an earlier run resumes from it either way.
+DOWNLOAD_SPOOL = False
+
 # --- EXTRACTION PARAMETERS ---
-# Number of parallel extractions for extracting LAZ to LAS
+# Input of the DEM stage:
+#   "laz" — las_to_dem.py reads the downloaded LAZ tiles in DATA_RAW
+#           directly, decompressing the LAZ chunks of each tile on all cores
+#           (lazrs). No LAS copies are written and laz_to_las.py is skipped.
+#   "las" — laz_to_las.py first extracts LAS copies into DATA_PROCESSED
+#           (e.g. for use in ArcGIS Pro) and las_to_dem.py reads those
+DEM_INPUT = "laz"
+
+# DEM cell size in metres (las_to_dem.py, in OUTPUT_CRS units)
+DEM_RESOLUTION = 2.0
+
+# DEM grid alignment (las_to_dem.py):
+#   "global" — every tile's cells lie on one study-wide lattice, with cell
+#              edges at DEM_GRID_ORIGIN + k * DEM_RESOLUTION, so neighbouring
+#              tiles share cell boundaries and mosaic_dem.py joins them by
+#              array copy, with no resampling
+#   "tile"   — each tile's grid starts at its own reprojected bounds
+#              (mosaic_dem.py resamples them with ArcGIS)
+DEM_GRID_ALIGN = "global"
+DEM_GRID_ORIGIN = (0.0, 0.0)    # (x, y) of a lattice corner, OUTPUT_CRS metres
+
+# LAZ to LAS extraction backend (laz_to_las.py):
+#   "lazrs"  — in-process, one file at a time with its LAZ chunks
+#              decompressed on all cores. Points, header and the kept
+#              VLRs/EVLRs match the source (COPC records are dropped).
+#              Works on any platform with lazrs-python installed.
+#   "laszip" — one laszip.exe subprocess per file (LASZIP_EXE), MAX_WORKERS
+#              files at a time
+EXTRACT_BACKEND = "lazrs"
+
+# Maximum number of parallel extractions for extracting LAZ to LAS (laszip
+# backend). Up to one per usable core is started; None = no cap.
 MAX_WORKERS = 4
 
 # Stream threshold (in pixels)
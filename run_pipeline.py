@@ -4,6 +4,8 @@ import time
 import os
 from pathlib import Path
 
+import config
+
 def sanitize_path():
     """Remove LAStools from PATH to prevent its GDAL DLL from conflicting with conda-forge's."""
     paths = os.environ["PATH"].split(os.pathsep)
@@ -39,13 +41,16 @@ ARCGIS_PYTHON = find_arcgis_python()
 
 SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts")
 
+# The lattice mosaic (config.DEM_GRID_ALIGN = "global") uses rasterio from ksn_env;
+# mosaicking tiles on their own grids ("tile") needs arcpy
+MOSAIC_PYTHON = KSNENV_PYTHON if config.DEM_GRID_ALIGN == "global" else ARCGIS_PYTHON
 
 SCRIPTS_TO_RUN = [
     ("batchdownload.py",           KSNENV_PYTHON),
     ("laz_to_las.py",              KSNENV_PYTHON),
     ("delete_empty_files.py",      KSNENV_PYTHON),
     ("las_to_dem.py",              KSNENV_PYTHON),
-    ("mosaic_dem.py",              ARCGIS_PYTHON),
+    ("mosaic_dem.py",              MOSAIC_PYTHON),
     ("wbt_hydrology.py",           KSNENV_PYTHON),
     ("stream_extraction_wbt.py",   ARCGIS_PYTHON),
     ("delineate_watersheds.py",    ARCGIS_PYTHON),
@@ -54,6 +59,10 @@ SCRIPTS_TO_RUN = [
     ("plot_stream_profiles.py",    KSNENV_PYTHON),
 ]
 
+# LAS extraction is only needed when the DEM stage reads LAS (config.DEM_INPUT)
+if config.DEM_INPUT != "las":
+    SCRIPTS_TO_RUN.remove(("laz_to_las.py", KSNENV_PYTHON))
+
 def run_script(script_name, python_exec):
     print(f"\n{'='*40}")
     print(f"RUNNING: {script_name}")
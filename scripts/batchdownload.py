@@ -6,20 +6,40 @@ traversing the EPT quadtree hierarchy and fetching LAZ node files.
 
 Replaces PDAL with requests + laspy, preserving identical output:
   - Spatial subsetting via bounding box
+  - Resolution-limited octree depth (config.RES, as readers.ept `resolution`)
   - Ground-only filtering (Classification=2)
-  - LAZ-compressed output
+  - Attribute selection: every attribute by default; with
+    config.DOWNLOAD_DIMENSIONS = "xyzc", X/Y/Z/classification only (skipped
+    LAZ layers are not decoded, tiles use a reduced point format, and the
+    fields that format still carries are listed in a VLR as zeroed)
+  - LAZ-compressed output (optionally COPC, see config.OUTPUT_FORMAT)
 
 EPT format reference: https://entwine.io/entwine-point-tile.html
 """
 
+import copy
 import io
+import os
 import sys
 import json
 import time
+import random
+import shutil
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from multiprocessing import shared_memory
 import requests
+from requests.adapters import HTTPAdapter
 import laspy
 import numpy as np
 from pathlib import Path
+import shapely
 from shapely.geometry import box
 
 # Project root (one level up from scripts/)
@@ -28,16 +48,613 @@ if str(root_dir) not in sys.path:
     sys.path.append(str(root_dir))
 
 import config
+from copc_writer import CopcWriter
+import tile_plan
+
+
+# ---------------------------------------------------------------------------
+# HTTP Session
+# ---------------------------------------------------------------------------
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide pooled HTTP session, creating it on first use.
+
+    The connection pool is sized to the largest number of requests that can
+    be in flight (DOWNLOAD_CONCURRENCY_MAX) so every request reuses a warm
+    keep-alive connection instead of paying a new TCP/TLS handshake per
+    node.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = max(1, config.DOWNLOAD_CONCURRENCY, config.DOWNLOAD_CONCURRENCY_MAX)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller for the number of node requests in flight.
+
+    The limit grows by one for every `limit` successful requests (about one
+    per round of requests) and is halved when the server throttles or
+    connections fail (429, 503 SlowDown, resets, timeouts). It is also cut
+    by 10% when the smoothed time-to-first-byte climbs past LATENCY_FACTOR
+    times its baseline, which signals queueing before S3 starts refusing
+    requests. The latency rule waits for LATENCY_MIN_SAMPLES requests and
+    ignores rises of less than LATENCY_SLACK_S, so ordinary jitter on a
+    fast link (a few ms against a ms baseline) does not trigger it. At most
+    one cut is made per smoothed round trip, so a burst of failures from
+    the same window counts once.
+    """
+
+    LATENCY_FACTOR = 2.0
+    LATENCY_MIN_SAMPLES = 20
+    LATENCY_SLACK_S = 0.05
+
+    def __init__(self, initial: int, maximum: int):
+        self.minimum = 1
+        self.maximum = max(initial, maximum)
+        self.limit = float(max(1, initial))
+        self.lowest = self.highest = self.current
+        self.cuts = 0
+        self._smoothed = None
+        self._baseline = None
+        self._samples = 0
+        self._last_cut = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def on_success(self, latency_s: float) -> None:
+        with self._lock:
+            self._samples += 1
+            if self._smoothed is None:
+                self._smoothed = self._baseline = latency_s
+            else:
+                self._smoothed = 0.8 * self._smoothed + 0.2 * latency_s
+                # The baseline follows the fastest round trips, drifting up
+                # slowly so a quiet start does not pin it forever
+                if self._smoothed < self._baseline:
+                    self._baseline = self._smoothed
+                else:
+                    self._baseline += 0.01 * (self._smoothed - self._baseline)
+
+            rise = max((self.LATENCY_FACTOR - 1) * self._baseline, self.LATENCY_SLACK_S)
+            if self._samples >= self.LATENCY_MIN_SAMPLES and self._smoothed > self._baseline + rise:
+                self._cut(0.9)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self.highest = max(self.highest, self.current)
+
+    def on_congestion(self) -> None:
+        with self._lock:
+            self._cut(0.5)
+
+    def _cut(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_cut < (self._smoothed or 1.0):
+            return
+        self._last_cut = now
+        self.limit = max(self.minimum, self.limit * factor)
+        self.lowest = min(self.lowest, self.current)
+        self.cuts += 1
+
+    def summary(self) -> str:
+        return (
+            f"Concurrency: {self.current} in flight at the end "
+            f"(range {self.lowest}-{self.highest}, max {self.maximum}), "
+            f"{self.cuts} back-offs"
+        )
+
+
+class BandwidthLimiter:
+    """Token bucket shared by every download thread."""
+
+    def __init__(self, bytes_per_s: float):
+        self.bytes_per_s = bytes_per_s
+        self.burst = bytes_per_s  # Up to one second of traffic at once
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, n_bytes: int) -> None:
+        """Account for n_bytes received, sleeping if the cap is exceeded."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.bytes_per_s)
+            self._last = now
+            self._tokens -= n_bytes
+            wait = -self._tokens / self.bytes_per_s if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+_concurrency = None
+_bandwidth = None
+_limits_lock = threading.Lock()
+
+
+def get_concurrency() -> AdaptiveConcurrency:
+    """Return the process-wide concurrency controller."""
+    global _concurrency
+    with _limits_lock:
+        if _concurrency is None:
+            _concurrency = AdaptiveConcurrency(
+                config.DOWNLOAD_CONCURRENCY, config.DOWNLOAD_CONCURRENCY_MAX
+            )
+        return _concurrency
+
+
+def get_bandwidth_limiter():
+    """Return the process-wide bandwidth limiter, or None when uncapped."""
+    global _bandwidth
+    if not config.DOWNLOAD_BANDWIDTH_MBPS:
+        return None
+    with _limits_lock:
+        if _bandwidth is None:
+            _bandwidth = BandwidthLimiter(config.DOWNLOAD_BANDWIDTH_MBPS * 1e6 / 8)
+        return _bandwidth
+
+
+def read_body(response: requests.Response) -> None:
+    """
+    Read a streamed response body in blocks under the bandwidth cap and
+    store it on the response, so .content and .json() work as usual.
+    """
+    limiter = get_bandwidth_limiter()
+    blocks = []
+    for block in response.iter_content(256 * 1024):
+        if limiter is not None:
+            limiter.consume(len(block))
+        blocks.append(block)
+    response._content = b"".join(blocks)
+
+
+# HTTP statuses worth retrying: throttling and transient server errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Retryable statuses that mean "slow down" rather than a server fault
+THROTTLE_STATUS = {429, 503}
+
+
+def http_get(url: str, timeout: float, headers: dict = None) -> tuple:
+    """
+    GET a URL on the pooled session, retrying transient failures with
+    exponential backoff and full jitter (up to DOWNLOAD_RETRIES times).
+    Returns (response, retries). Non-retryable statuses such as 404 are
+    returned to the caller unchanged.
+
+    Every attempt is reported to the concurrency controller: throttling and
+    connection failures shrink the number of requests in flight, and
+    successful round trips let it grow again.
+    """
+    concurrency = get_concurrency()
+    retries = 0
+    while True:
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout, stream=True)
+            if response.status_code not in RETRY_STATUS:
+                concurrency.on_success(response.elapsed.total_seconds())
+                read_body(response)
+                return response, retries
+            response.close()
+            if response.status_code in THROTTLE_STATUS:
+                concurrency.on_congestion()
+            error = requests.HTTPError(
+                f"HTTP {response.status_code} for {url}", response=response
+            )
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError
+        ) as e:
+            concurrency.on_congestion()
+            error = e
+
+        if retries >= config.DOWNLOAD_RETRIES:
+            raise error
+        time.sleep(random.uniform(0, config.RETRY_BACKOFF_S * 2 ** retries))
+        retries += 1
+
+
+# ---------------------------------------------------------------------------
+# Local EPT Sources
+# ---------------------------------------------------------------------------
+
+def is_local_source(url: str) -> bool:
+    """True for a file:// URL or a plain filesystem path (e.g. a mirror)."""
+    return not url.startswith(("http://", "https://"))
+
+
+def local_path(url: str) -> Path:
+    """Filesystem path of a file:// URL or plain path."""
+    if url.startswith("file://"):
+        return Path(url2pathname(urlparse(url).path))
+    return Path(url)
+
+
+def ept_base_url(ept_url: str) -> str:
+    """Dataset root of an ept.json URL or path (strips the file name)."""
+    if is_local_source(ept_url) and not ept_url.startswith("file://"):
+        return str(Path(ept_url).parent)
+    return ept_url.rsplit("/", 1)[0]
+
+
+def read_local(path: Path) -> bytes:
+    """
+    Read a file of a local EPT source. A plain read: the bytes are parsed,
+    cached or sent to a decode worker whole, so a memory map would only be
+    copied out again.
+    """
+    return Path(path).read_bytes()
+
+
+# ---------------------------------------------------------------------------
+# EPT Metadata Cache
+# ---------------------------------------------------------------------------
+
+# Parsed JSON documents keyed by URL, validated at most once per process.
+# A value of None records a page the server does not have (HTTP 404).
+_json_cache = {}
+_json_cache_lock = threading.Lock()
+
+# Merged hierarchy per dataset base URL, shared by every tile in the run.
+_hierarchies = {}
+
+
+def _json_cache_path(url: str) -> Path:
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return Path(config.EPT_CACHE_DIR) / "json" / f"{digest}.json"
+
+
+def _write_json_atomic(path: Path, data: dict) -> None:
+    """Write JSON to a temp file and rename it into place."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def fetch_json_cached(url: str):
+    """
+    Fetch a JSON document through the on-disk EPT metadata cache.
+
+    The first request for a URL in this process is sent as a conditional GET
+    using the ETag/Last-Modified stored with the disk copy; a 304 response
+    reuses the cached body. Every later request for the same URL is answered
+    from memory without touching the network.
+
+    Returns None if the server reports the document does not exist (404).
+    Local sources (file:// or a plain path) are read directly, bypassing
+    the disk cache.
+    """
+    with _json_cache_lock:
+        if url in _json_cache:
+            return _json_cache[url]
+
+    if is_local_source(url):
+        path = local_path(url)
+        data = json.loads(read_local(path)) if path.exists() else None
+        with _json_cache_lock:
+            _json_cache[url] = data
+        return data
+
+    cache_path = _json_cache_path(url)
+    entry = None
+    if cache_path.exists():
+        try:
+            with open(cache_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None  # Corrupt entry — refetch below
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response, _ = http_get(url, timeout=30, headers=headers)
+
+    if response.status_code == 304 and entry is not None:
+        data = entry["body"]
+    elif response.status_code == 404:
+        data = None
+    else:
+        response.raise_for_status()
+        data = response.json()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            _write_json_atomic(cache_path, {
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "body": data,
+            })
+
+    with _json_cache_lock:
+        _json_cache[url] = data
+    return data
+
+
+def get_hierarchy(base_url: str) -> dict:
+    """
+    Return the process-wide hierarchy dict for an EPT dataset, seeded from
+    the root page. collect_nodes merges sub-hierarchy pages into this same
+    dict, so pages loaded for one tile are reused by every later tile.
+    """
+    with _json_cache_lock:
+        hierarchy = _hierarchies.get(base_url)
+    if hierarchy is None:
+        root = fetch_json_cached(f"{base_url}/ept-hierarchy/0-0-0-0.json")
+        if root is None:
+            raise ValueError(f"EPT root hierarchy not found under {base_url}")
+        with _json_cache_lock:
+            hierarchy = _hierarchies.setdefault(base_url, dict(root))
+    return hierarchy
+
+
+def loaded_hierarchy_pages(base_url: str) -> dict:
+    """Every hierarchy page of a dataset fetched so far in this process, by key."""
+    prefix = f"{base_url}/ept-hierarchy/"
+    with _json_cache_lock:
+        return {
+            url[len(prefix):-len(".json")]: page
+            for url, page in _json_cache.items()
+            if url.startswith(prefix) and page is not None
+        }
+
+
+# ---------------------------------------------------------------------------
+# EPT Node Cache
+# ---------------------------------------------------------------------------
+
+class NodeCache:
+    """
+    Disk-backed LRU cache of raw EPT node files.
+
+    Entries are addressed by a hash of the dataset URL and node key, written
+    atomically (temp file + rename), and evicted least-recently-used first
+    once the total size exceeds max_bytes. Recency survives restarts because
+    each hit refreshes the file's modification time.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_from_cache = 0
+        self.bytes_downloaded = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> size, oldest first
+        self._total_bytes = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        existing = []
+        for path in self.cache_dir.glob("*/*.laz"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            existing.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(existing):
+            self._entries[path] = size
+            self._total_bytes += size
+
+        # Leftovers from an interrupted write are never valid entries
+        for tmp_path in self.cache_dir.glob("*/*.tmp"):
+            tmp_path.unlink(missing_ok=True)
+
+    def _path(self, base_url: str, key: str) -> Path:
+        digest = hashlib.sha256(f"{base_url}|{key}".encode("utf-8")).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}.laz"
+
+    def get(self, base_url: str, key: str):
+        """Return the cached bytes for a node, or None on a miss."""
+        path = self._path(base_url, key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            self.bytes_from_cache += len(data)
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        return data
+
+    def put(self, base_url: str, key: str, data: bytes) -> None:
+        """Store a node atomically, then evict old entries past the size cap."""
+        path = self._path(base_url, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.bytes_downloaded += len(data)
+            self._total_bytes -= self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self._total_bytes += len(data)
+
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                old_path.unlink(missing_ok=True)
+                self._total_bytes -= old_size
+                self.evictions += 1
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return (
+            f"Node cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate) | "
+            f"{self.bytes_downloaded / 1024**2:.1f} MB downloaded, "
+            f"{self.bytes_from_cache / 1024**2:.1f} MB served from cache | "
+            f"{self.evictions} evictions, {self._total_bytes / 1024**3:.2f} GB on disk"
+        )
+
+
+_node_cache = None
+_node_cache_lock = threading.Lock()
+
+
+def get_node_cache():
+    """Return the process-wide node cache, or None if it is disabled."""
+    global _node_cache
+    with _node_cache_lock:
+        if _node_cache is None and config.NODE_CACHE_MAX_GB > 0:
+            _node_cache = NodeCache(
+                config.NODE_CACHE_DIR,
+                int(config.NODE_CACHE_MAX_GB * 1024**3)
+            )
+        return _node_cache
+
+
+# ---------------------------------------------------------------------------
+# EPT Hierarchy Index
+# ---------------------------------------------------------------------------
+
+def key_addresses(keys: list) -> np.ndarray:
+    """(n, 4) int64 array of the (d, x, y, z) addresses of "d-x-y-z" keys."""
+    return np.array([key.split("-") for key in keys], dtype=np.int64).reshape(-1, 4)
+
+
+def address_bounds(ept_bounds: list, address: np.ndarray) -> np.ndarray:
+    """Vectorized node_bounds: (minx, miny, maxx, maxy) per address row."""
+    minx, miny, _, maxx, maxy, _ = ept_bounds
+    d, x, y = address[:, 0], address[:, 1], address[:, 2]
+    step_x = (maxx - minx) / (2 ** d)
+    step_y = (maxy - miny) / (2 ** d)
+    return np.column_stack([
+        minx + x * step_x,
+        miny + y * step_y,
+        minx + (x + 1) * step_x,
+        miny + (y + 1) * step_y,
+    ])
+
+
+class HierarchyIndex:
+    """
+    Array view of a merged EPT hierarchy dict, for vectorized spatial
+    queries: one row per node, with int64 columns d, x, y, z and count, and
+    float64 node bounds.
+
+    The dict stays the source of truth (pages are merged into it as they
+    are fetched); refresh() brings the arrays up to date, parsing only the
+    keys added since the last refresh.
+    """
+
+    def __init__(self, hierarchy: dict, ept_bounds: list):
+        self.hierarchy = hierarchy
+        self.ept_bounds = ept_bounds
+        self.keys = np.empty(0, dtype=object)
+        self.address = np.empty((0, 4), dtype=np.int64)
+        self.count = np.empty(0, dtype=np.int64)
+        self.bounds = np.empty((0, 4), dtype=np.float64)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Index keys added to the hierarchy dict and re-read all counts."""
+        n_old = len(self.keys)
+        if len(self.hierarchy) > n_old:
+            # Dicts keep insertion order, so new keys are at the end
+            new_keys = list(islice(self.hierarchy, n_old, None))
+            new_address = key_addresses(new_keys)
+            self.keys = np.concatenate([self.keys, np.array(new_keys, dtype=object)])
+            self.address = np.concatenate([self.address, new_address])
+            self.bounds = np.concatenate([self.bounds, address_bounds(self.ept_bounds, new_address)])
+
+        # Merging a sub-page replaces its root's -1 with the real count
+        self.count = np.fromiter(self.hierarchy.values(), dtype=np.int64, count=len(self.hierarchy))
+
+    def query(self, query_box: tuple, max_depth: int = None, area=None) -> np.ndarray:
+        """
+        Row numbers of all listed nodes (any count, including 0 and -1) down
+        to max_depth whose bounds intersect query_box and, if given, the
+        area polygon. Rows are in breadth-first traversal order: by depth,
+        then by Morton (octree) order within each depth.
+        """
+        b = self.bounds
+        mask = (
+            (b[:, 2] > query_box[0]) & (query_box[2] > b[:, 0]) &
+            (b[:, 3] > query_box[1]) & (query_box[3] > b[:, 1])
+        )
+        if max_depth is not None:
+            mask &= self.address[:, 0] <= max_depth
+
+        rows = np.flatnonzero(mask)
+        if area is not None and len(rows) > 0:
+            shapely.prepare(area)
+            boxes = shapely.box(b[rows, 0], b[rows, 1], b[rows, 2], b[rows, 3])
+            rows = rows[shapely.intersects(area, boxes)]
+
+        a = self.address[rows].astype(np.uint64)
+        morton = np.zeros(len(rows), dtype=np.uint64)
+        for bit in range(int(a[:, 0].max(initial=0)) - 1, -1, -1):
+            for axis in (1, 2, 3):
+                morton = (morton << np.uint64(1)) | ((a[:, axis] >> np.uint64(bit)) & np.uint64(1))
+        return rows[np.lexsort((morton, a[:, 0]))]
+
+
+# Array index per hierarchy dict, keyed by dataset base URL
+_hierarchy_indexes = {}
+
+
+def get_hierarchy_index(base_url: str, hierarchy: dict, ept_bounds: list) -> HierarchyIndex:
+    """Return the (refreshed) HierarchyIndex over a dataset's hierarchy dict."""
+    with _json_cache_lock:
+        index = _hierarchy_indexes.get(base_url)
+        if index is None or index.hierarchy is not hierarchy:
+            index = _hierarchy_indexes[base_url] = HierarchyIndex(hierarchy, ept_bounds)
+        else:
+            index.refresh()
+    return index
 
 
 # ---------------------------------------------------------------------------
 # EPT Helpers
 # ---------------------------------------------------------------------------
 
-def fetch_json(url: str) -> dict:
-    response = requests.get(url, timeout=30)
-    response.raise_for_status()
-    return response.json()
+def load_study_area():
+    """
+    Return the study area in EPSG:3857: the polygon(s) in config.AOI_PATH
+    if set, otherwise the config.BOUNDS_STR rectangle.
+    """
+    if config.AOI_PATH:
+        import geopandas as gpd  # Only needed for AOI files
+
+        aoi = gpd.read_file(config.AOI_PATH)
+        if aoi.crs is not None:
+            aoi = aoi.to_crs("EPSG:3857")
+        return shapely.union_all(list(aoi.geometry))
+
+    clean = config.BOUNDS_STR.replace("(", "").replace(")", "").replace("[", "").replace("]", "")
+    p = [float(x) for x in clean.split(",")]
+    return box(p[0], p[2], p[1], p[3])
 
 
 def node_bounds(ept_bounds: list, d: int, x: int, y: int) -> tuple:
@@ -58,180 +675,1047 @@ def node_bounds(ept_bounds: list, d: int, x: int, y: int) -> tuple:
     )
 
 
+def key_bounds(ept_bounds: list, key: str) -> tuple:
+    """node_bounds for a "d-x-y-z" hierarchy key."""
+    d, x, y, _ = (int(v) for v in key.split("-"))
+    return node_bounds(ept_bounds, d, x, y)
+
+
 def boxes_intersect(a: tuple, b: tuple) -> bool:
     """Check if two (minx, miny, maxx, maxy) boxes intersect."""
     return not (a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1])
 
 
+def fetch_hierarchy_pages(base_url: str, keys: list) -> list:
+    """
+    Fetch several ept-hierarchy pages concurrently through the metadata
+    cache. Returns the parsed pages in the same order as keys, with None for
+    any page the server does not have. Misses are remembered by the cache,
+    so a missing page is requested at most once per run.
+    """
+    if not keys:
+        return []
+    urls = [f"{base_url}/ept-hierarchy/{key}.json" for key in keys]
+    if len(urls) == 1:
+        return [fetch_json_cached(urls[0])]
+    workers = min(len(urls), max(1, config.DOWNLOAD_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fetch_json_cached, urls))
+
+
+def depth_for_resolution(ept_info: dict, resolution) -> int:
+    """
+    Return the deepest octree depth needed to reach a point spacing of
+    `resolution` metres, or None to keep every depth.
+
+    Each EPT node is a grid of `span` cells per side, so the root samples the
+    dataset cube at width / span and every deeper level halves that spacing.
+    This matches the depth selection of PDAL's readers.ept `resolution`.
+    """
+    if not resolution:
+        return None
+    minx, _, _, maxx, _, _ = ept_info["bounds"]
+    spacing = (maxx - minx) / ept_info["span"]
+    depth = 0
+    while spacing > resolution:
+        spacing /= 2
+        depth += 1
+    return depth
+
+
 def collect_nodes(
     hierarchy: dict,
     ept_bounds: list,
     query_box: tuple,
     base_url: str,
-    d: int = 0,
-    x: int = 0,
-    y: int = 0,
-    z: int = 0,
-    nodes: list = None
+    max_depth: int = None,
+    area=None
 ) -> list:
     """
-    Recursively traverse the EPT hierarchy to collect all node keys
-    whose bounds intersect the query bounding box.
+    Collect all node keys down to max_depth whose bounds intersect the
+    query bounding box and, if given, the area polygon (see
+    load_study_area).
+
+    EPT stores each point in exactly one node, coarse points near the root
+    and finer detail deeper down, so every intersecting node at every depth
+    is collected; stopping at max_depth thins the cloud to that resolution.
 
-    Fetches sub-hierarchy JSON pages as needed (EPT splits large hierarchies
-    into separate JSON files at certain depths).
+    Per the EPT spec, a point count of -1 marks a node whose subtree lives in
+    a separate ept-hierarchy/{key}.json page. Only those pages are requested
+    (and only when the query will descend below them); every page visible
+    from the hierarchy loaded so far is fetched concurrently in one batch,
+    until no further pages are needed. Fetched pages are merged into
+    hierarchy, which is shared across tiles, so later tiles resolve from
+    memory.
+
+    The query itself is one vectorized pass over a HierarchyIndex. A node
+    can only intersect the query if its parent does, so filtering every
+    listed node by bounds yields the same set as walking the tree, in the
+    same breadth-first order.
 
     Note: The root node (0-0-0-0) is often absent from the hierarchy JSON
     itself — its existence is implied by ept.json. We handle this by treating
-    the root as always present and starting recursion from its children.
+    the root as always present.
     """
-    if nodes is None:
-        nodes = []
-
-    key = f"{d}-{x}-{y}-{z}"
+    index = get_hierarchy_index(base_url, hierarchy, ept_bounds)
 
-    # Root node is implied — skip the point count check for it
-    # For all other nodes, check if they exist in the hierarchy
-    if d > 0:
-        point_count = hierarchy.get(key)
-        if point_count is None or point_count == 0:
-            return nodes  # Node doesn't exist or has no points
+    # --- Resolve the sub-hierarchy pages the query descends into ---
+    page_depth = None if max_depth is None else max_depth - 1
+    requested = set()
+    while page_depth is None or page_depth >= 0:
+        rows = index.query(query_box, page_depth, area)
+        paged = [key for key in index.keys[rows[index.count[rows] == -1]] if key not in requested]
+        if not paged:
+            break
+        requested.update(paged)
+        for page in fetch_hierarchy_pages(base_url, paged):
+            if page:
+                hierarchy.update(page)
+        index.refresh()
 
-        nb = node_bounds(ept_bounds, d, x, y)
-        if not boxes_intersect(nb, query_box):
-            return nodes  # Node doesn't overlap our tile
+    # --- Every present node intersecting the query ---
+    rows = index.query(query_box, max_depth, area)
+    nodes = index.keys[rows[index.count[rows] != 0]].tolist()
 
-        # Always try to fetch sub-hierarchy page — children may be in a
-        # separate JSON file regardless of whether point_count is -1
-        sub_url = f"{base_url}/ept-hierarchy/{key}.json"
-        try:
-            sub_hierarchy = fetch_json(sub_url)
-            hierarchy.update(sub_hierarchy)
-        except Exception:
-            pass  # No sub-page for this node, that's fine
-
-        # Only collect leaf nodes to avoid double-counting points.
-        # A node is a leaf if none of its children exist in the hierarchy.
-        child_keys = [
-            f"{d+1}-{x*2+dx}-{y*2+dy}-{z*2+dz}"
-            for dx in range(2) for dy in range(2) for dz in range(2)
-        ]
-        has_intersecting_children = any(
-            hierarchy.get(ck, 0) > 0 and
-            boxes_intersect(
-                node_bounds(ept_bounds, d+1, x*2+(i//4), y*2+((i//2)%2)), query_box
-            )
-            for i, ck in enumerate(child_keys)
-        )
-        if not has_intersecting_children:
-            nodes.append(key)
+    if "0-0-0-0" not in hierarchy:
+        root = node_bounds(ept_bounds, 0, 0, 0)
+        if boxes_intersect(root, query_box) and (area is None or area.intersects(box(*root))):
+            nodes.insert(0, "0-0-0-0")
+    return nodes
 
-    else:
-        # Root: always check spatial overlap but don't require it in hierarchy
-        nb = node_bounds(ept_bounds, d, x, y)
-        if not boxes_intersect(nb, query_box):
-            return nodes
-
-    # Recurse into all 8 children (EPT is a full octree: 2x2x2)
-    for dx in range(2):
-        for dy in range(2):
-            for dz in range(2):
-                collect_nodes(
-                    hierarchy, ept_bounds, query_box, base_url,
-                    d + 1, x * 2 + dx, y * 2 + dy, z * 2 + dz,
-                    nodes
-                )
 
-    return nodes
+def download_node(base_url: str, key: str) -> tuple:
+    """
+    Return (raw_bytes, retries) for a single EPT LAZ node file, serving it
+    from the local node cache when a neighbouring tile has already
+    downloaded it. Nodes of a local source are read straight from disk.
+    """
+    if is_local_source(base_url):
+        return read_local(local_path(f"{base_url}/ept-data/{key}.laz")), 0
 
+    cache = get_node_cache()
+    if cache is not None:
+        raw = cache.get(base_url, key)
+        if raw is not None:
+            return raw, 0
 
-def download_node(base_url: str, key: str) -> bytes:
-    """Download a single EPT LAZ node file and return its raw bytes."""
     url = f"{base_url}/ept-data/{key}.laz"
-    response = requests.get(url, timeout=120)
+    response, retries = http_get(url, timeout=120)
     response.raise_for_status()
-    return response.content
+    raw = response.content
+
+    if cache is not None:
+        cache.put(base_url, key, raw)
+    return raw, retries
+
+
+def fetch_nodes(base_url: str, keys: list, on_error=None):
+    """
+    Download EPT nodes concurrently, yielding (key, raw_bytes, retries) in
+    completion order so the caller can decode each node as soon as it
+    arrives. A node that fails for good is passed to on_error(key,
+    exception) and skipped, or, without on_error, its exception is raised.
+
+    The number of requests in flight follows the adaptive concurrency
+    limit (see AdaptiveConcurrency), between 1 and DOWNLOAD_CONCURRENCY_MAX.
+    A new request is only issued when the window has room, so memory is
+    bounded by the window rather than by the total number of nodes.
+    """
+    concurrency = get_concurrency()
+    key_iter = iter(keys)
+    pending = {}
+
+    def fill():
+        while len(pending) < concurrency.current:
+            key = next(key_iter, None)
+            if key is None:
+                return
+            pending[executor.submit(download_node, base_url, key)] = key
+
+    executor = ThreadPoolExecutor(max_workers=concurrency.maximum)
+    try:
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+
+                # Refill the window before handing the node to the caller,
+                # so downloads continue while the caller decodes.
+                fill()
+
+                try:
+                    raw, retries = future.result()
+                except Exception as e:
+                    if on_error is None:
+                        raise
+                    on_error(key, e)
+                    continue
+                yield key, raw, retries
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 # ---------------------------------------------------------------------------
-# Main Download Function
+# Download Ledger
 # ---------------------------------------------------------------------------
 
-def run_download(tile_box, filename: str):
+class DownloadLedger:
     """
-    Downloads all EPT nodes intersecting tile_box, merges them, filters to
-    ground points (Classification=2), and writes a LAZ file.
+    Append-only JSON-lines record of download progress.
+
+    Each line is one event: a tile's planned node list, a node finishing
+    (with its byte count, retries, and ground point count), a node failing,
+    or a tile being completed. Replaying the file on start-up restores the
+    state, so a restarted run reuses each tile's node plan and skips nodes
+    whose filtered points are already spooled. A line torn by a crash is
+    ignored.
     """
-    b = tile_box.bounds  # (minx, miny, maxx, maxy)
-    query_box = (b[0], b[1], b[2], b[3])
-    base_url = config.EPT_URL.rsplit("/", 1)[0]  # strip ept.json
 
-    # --- Step 1: Load EPT metadata and root hierarchy ---
-    ept_info = fetch_json(config.EPT_URL)
-    ept_bounds = ept_info["bounds"]  # [minx, miny, minz, maxx, maxy, maxz]
-    hierarchy = fetch_json(f"{base_url}/ept-hierarchy/0-0-0-0.json")
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.tiles = {}
+        self.nodes_done = 0
+        self.nodes_failed = 0
+        self.retries = 0
+        self._lock = threading.Lock()
 
-    # --- Step 2: Find all nodes that intersect our tile ---
-    nodes = collect_nodes(hierarchy, ept_bounds, query_box, base_url)
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        continue  # Torn final line from an interrupted run
 
-    if not nodes:
-        raise ValueError(
-            f"No EPT nodes found intersecting bounds {query_box}. "
-            "Check that BOUNDS_STR in config.py is within the dataset extent."
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a")
+
+    def _tile(self, tile: str) -> dict:
+        return self.tiles.setdefault(tile, {"nodes": None, "done": {}, "complete": False})
+
+    def _apply(self, record: dict) -> None:
+        state = self._tile(record["tile"])
+        event = record["event"]
+        if event == "plan":
+            state["nodes"] = record["nodes"]
+            state["bounds"] = record.get("bounds")
+            state["max_depth"] = record.get("max_depth")
+            state["dimensions"] = record.get("dimensions")
+            state["done"] = {}
+            state["complete"] = False
+        elif event == "node_done":
+            state["done"][record["node"]] = record
+        elif event == "tile_done":
+            state["complete"] = True
+
+    def _append(self, record: dict) -> None:
+        with self._lock:
+            self._apply(record)
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def planned_nodes(self, tile: str, bounds: list, max_depth):
+        """
+        Return the recorded node list for a tile, or None if the tile has
+        not been planned with these bounds, depth and decoded dimensions
+        (e.g. after a change to TILE_SIZE, RES or DOWNLOAD_DIMENSIONS in
+        config.py).
+        """
+        state = self.tiles.get(tile)
+        if not state or state["nodes"] is None:
+            return None
+        if state.get("bounds") != list(bounds) or state.get("max_depth") != max_depth:
+            return None
+        if state.get("dimensions") != config.DOWNLOAD_DIMENSIONS:
+            return None
+        return state["nodes"]
+
+    def completed_nodes(self, tile: str) -> dict:
+        """Return {node_key: record} for the tile's finished nodes."""
+        state = self.tiles.get(tile)
+        return dict(state["done"]) if state else {}
+
+    def plan(self, tile: str, bounds: list, max_depth, nodes: list) -> None:
+        self._append({
+            "event": "plan", "tile": tile, "bounds": list(bounds),
+            "max_depth": max_depth, "dimensions": config.DOWNLOAD_DIMENSIONS, "nodes": nodes
+        })
+
+    def node_done(self, tile: str, key: str, size: int, retries: int, points: int) -> None:
+        self.nodes_done += 1
+        self.retries += retries
+        self._append({
+            "event": "node_done", "tile": tile, "node": key,
+            "bytes": size, "retries": retries, "points": points,
+            "time": time.time()
+        })
+
+    def node_failed(self, tile: str, error: str, node: str = None, tiles: list = None) -> None:
+        self.nodes_failed += 1
+        record = {"event": "node_failed", "tile": tile, "error": error, "time": time.time()}
+        if node is not None:
+            record.update({"node": node, "tiles": tiles or []})
+        self._append(record)
+
+    def tile_done(self, tile: str) -> None:
+        self._append({"event": "tile_done", "tile": tile, "time": time.time()})
+
+    def summary(self) -> str:
+        return (
+            f"Ledger: {self.nodes_done} nodes spooled this run, "
+            f"{self.retries} retries, {self.nodes_failed} node failures"
         )
 
-    # --- Step 3: Download and merge all intersecting nodes ---
-    all_points = []
-    header = None
+    def close(self) -> None:
+        self._file.close()
+
+
+# ---------------------------------------------------------------------------
+# Node Decoding
+# ---------------------------------------------------------------------------
+
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+# LAZ layers needed to ground-filter a node and grid it into a DEM
+XYZC_LAYERS = (
+    laspy.DecompressionSelection.XY_RETURNS_CHANNEL |
+    laspy.DecompressionSelection.Z |
+    laspy.DecompressionSelection.CLASSIFICATION
+)
+
+# Fields stored in those layers; the return numbers share the XY layer
+XYZC_FIELDS = ("X", "Y", "Z", "classification", "return_number", "number_of_returns")
+
+# VLR listing the fields of an "xyzc" tile that hold zeros, not data
+ZEROED_FIELDS_VLR = ("ksn-project", 1)
 
-    for key in nodes:
-        raw = download_node(base_url, key)
-        with laspy.open(io.BytesIO(raw)) as reader:
-            las = reader.read()
-            if header is None:
-                header = las.header
-            all_points.append(las.points)
 
-    merged_points = np.concatenate(all_points) if len(all_points) > 1 else all_points[0]
+def decompression_selection() -> laspy.DecompressionSelection:
+    """LAZ layers to decode from each node, per config.DOWNLOAD_DIMENSIONS."""
+    if config.DOWNLOAD_DIMENSIONS == "xyzc":
+        return XYZC_LAYERS
+    return laspy.DecompressionSelection.all()
 
-    # --- Step 4: Spatial clip to exact tile bounds ---
-    # Nodes are coarser than our tile so we clip precisely.
+
+def xyzc_point_format(point_format) -> laspy.PointFormat:
+    """
+    Smallest point format of the same family as point_format: 0 for
+    formats 0-5, 6 for formats 6-10. Colour, NIR, waveform and extra-byte
+    fields are dropped (and GPS time for formats 0-5).
+    """
+    return laspy.PointFormat(6 if point_format.id >= 6 else 0)
+
+
+def zeroed_fields(point_format) -> list:
+    """Fields of an "xyzc" point format that are not decoded, so hold zeros."""
+    return [name for name in point_format.dimension_names if name not in XYZC_FIELDS]
+
+
+def output_header(header, selection):
+    """
+    Header the decoded points of a node are written with. Unchanged for a
+    full decode. With XYZC_LAYERS, a copy using xyzc_point_format, carrying
+    a VLR (ZEROED_FIELDS_VLR) that names the fields stored as zeros, so
+    they cannot be mistaken for measured values.
+    """
+    if selection != XYZC_LAYERS:
+        return header
+    reduced = copy.deepcopy(header)
+    point_format = xyzc_point_format(header.point_format)
+    reduced.set_version_and_point_format(header.version, point_format)
+    user_id, record_id = ZEROED_FIELDS_VLR
+    reduced.vlrs = [vlr for vlr in reduced.vlrs if (vlr.user_id, vlr.record_id) != ZEROED_FIELDS_VLR]
+    reduced.vlrs.append(laspy.VLR(
+        user_id, record_id, "Zeroed point fields (not decoded)",
+        ",".join(zeroed_fields(point_format)).encode()
+    ))
+    return reduced
+
+
+def point_xy(header, points) -> tuple:
+    """Real-world x/y coordinate arrays of a point record."""
     # Coordinates are stored as integers: real = offset + scale * int_val
-    x_offset = header.offsets[0]
-    y_offset = header.offsets[1]
-    x_scale  = header.scales[0]
-    y_scale  = header.scales[1]
+    x_coords = header.offsets[0] + header.scales[0] * points.X.astype(np.float64)
+    y_coords = header.offsets[1] + header.scales[1] * points.Y.astype(np.float64)
+    return x_coords, y_coords
+
 
-    x_coords = x_offset + x_scale * merged_points.X.astype(np.float64)
-    y_coords = y_offset + y_scale * merged_points.Y.astype(np.float64)
+def decode_ground_points(raw: bytes, selection=None) -> tuple:
+    """
+    Decode a single EPT node and keep only ground points (Classification=2).
+    Returns (header, points, x_coords, y_coords) with real-world x/y arrays
+    for the surviving points.
 
-    spatial_mask = (
-        (x_coords >= b[0]) & (x_coords <= b[2]) &
-        (y_coords >= b[1]) & (y_coords <= b[3])
+    selection limits which LAZ layers are decompressed (all by default).
+    For point formats 6-10, whose LAZ encoding stores each attribute group
+    as a separate layer, skipped layers are never decompressed; older
+    formats are always decoded in full. With XYZC_LAYERS, the points are
+    returned in xyzc_point_format, with the fields outside XYZC_FIELDS
+    zeroed, and the header is output_header's.
+    """
+    if selection is None:
+        selection = laspy.DecompressionSelection.all()
+    with laspy.open(io.BytesIO(raw), decompression_selection=selection) as reader:
+        header = reader.header
+        points = reader.read_points(header.point_count)
+
+    points = points[points.classification == 2]
+
+    # Skipped layers hold stale values from the last decoded point
+    if selection == XYZC_LAYERS:
+        kept = laspy.PackedPointRecord.zeros(len(points), xyzc_point_format(points.point_format))
+        for name in XYZC_FIELDS:
+            kept[name] = points[name]
+        points = kept
+
+    x_coords, y_coords = point_xy(header, points)
+    return output_header(header, selection), points, x_coords, y_coords
+
+
+def box_mask(x_coords: np.ndarray, y_coords: np.ndarray, query_box: tuple) -> np.ndarray:
+    """Boolean mask of points inside a (minx, miny, maxx, maxy) box."""
+    return (
+        (x_coords >= query_box[0]) & (x_coords <= query_box[2]) &
+        (y_coords >= query_box[1]) & (y_coords <= query_box[3])
     )
 
-    # --- Step 5: Filter to ground points only (Classification=2) ---
-    ground_mask  = merged_points.classification == 2
-    final_mask   = spatial_mask & ground_mask
-    final_points = merged_points[final_mask]
 
-    if len(final_points) == 0:
+def clip_mask(x_coords: np.ndarray, y_coords: np.ndarray, query_box: tuple, area=None) -> np.ndarray:
+    """
+    Boolean mask of points inside query_box and, if given, the area
+    polygon. The per-point polygon test is skipped when the points'
+    bounding box lies wholly inside the area, which holds for all but the
+    nodes along the area's boundary.
+    """
+    mask = box_mask(x_coords, y_coords, query_box)
+    if area is None or not mask.any():
+        return mask
+
+    shapely.prepare(area)
+    x_in, y_in = x_coords[mask], y_coords[mask]
+    if not area.contains(box(x_in.min(), y_in.min(), x_in.max(), y_in.max())):
+        mask[mask] = shapely.contains_xy(area, x_in, y_in)
+    return mask
+
+
+def get_decode_pool():
+    """
+    Return the process-wide LAZ decode pool, creating it on first use, or
+    None when DECODE_WORKERS is 0.
+
+    Workers are spawned rather than forked: the download threads are
+    already running when the pool starts, and forking a threaded process
+    is unsafe.
+    """
+    global _decode_pool
+    if config.DECODE_WORKERS <= 0:
+        return None
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            _decode_pool = ProcessPoolExecutor(
+                max_workers=config.DECODE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _decode_pool
+
+
+def shutdown_decode_pool() -> None:
+    """Stop the decode pool's worker processes, if it was started."""
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is not None:
+            _decode_pool.shutdown(cancel_futures=True)
+            _decode_pool = None
+
+
+def decode_to_shared(raw: bytes, block_name: str, query_box: tuple, area, selection) -> int:
+    """
+    Decode-pool worker: decode a node, keep its ground points (inside
+    query_box and area, if given), and copy the surviving point records into the
+    shared memory block allocated by the caller. Returns the point count.
+    """
+    _, points, x_coords, y_coords = decode_ground_points(raw, selection)
+    if query_box is not None:
+        points = points[clip_mask(x_coords, y_coords, query_box, area)]
+
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        array = points.array
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+    finally:
+        block.close()
+    return len(points)
+
+
+def decode_nodes(base_url: str, keys: list, query_box: tuple = None, area=None, on_error=None):
+    """
+    Download and decode EPT nodes, yielding (key, header, points, n_bytes,
+    retries) in completion order, with points reduced to ground points
+    (inside query_box and area, if given). As in fetch_nodes, a node that
+    fails to download or decode goes to on_error(key, exception) if given.
+
+    With DECODE_WORKERS > 0, each node is handed to the decode pool as soon
+    as it arrives, so downloading, decompression, and the caller's writing
+    all overlap. The pool returns points through shared memory: a block
+    sized for the node's full point count is allocated here, the worker
+    writes the filtered records into it, and only the block name and a
+    count cross the process boundary. This process owns every block, so
+    none outlives the run even if it is interrupted. Up to two nodes per
+    worker are queued for decoding at once, which bounds memory.
+    """
+    # Passed to workers explicitly: spawned processes re-import config and
+    # would not see settings changed at runtime
+    selection = decompression_selection()
+    pool = get_decode_pool()
+    if pool is None:
+        for key, raw, retries in fetch_nodes(base_url, keys, on_error):
+            try:
+                header, points, x_coords, y_coords = decode_ground_points(raw, selection)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(key, e)
+                continue
+            if query_box is not None:
+                points = points[clip_mask(x_coords, y_coords, query_box, area)]
+            yield key, header, points, len(raw), retries
+        return
+
+    limit = 2 * config.DECODE_WORKERS
+    pending = {}
+
+    def collect(future):
+        """The decoded node, or None if it failed and went to on_error."""
+        key, header, block, n_bytes, retries = pending.pop(future)
+        try:
+            count = future.result()
+            point_format = header.point_format
+            array = np.ndarray(count, point_format.dtype(), buffer=block.buf).copy()
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(key, e)
+            return None
+        finally:
+            block.close()
+            block.unlink()
+        return key, header, laspy.PackedPointRecord(array, point_format), n_bytes, retries
+
+    try:
+        for key, raw, retries in fetch_nodes(base_url, keys, on_error):
+            # The header is uncompressed, so reading it here is cheap
+            try:
+                header = output_header(laspy.LasHeader.read_from(io.BytesIO(raw)), selection)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(key, e)
+                continue
+            size = max(1, header.point_count * header.point_format.size)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            try:
+                future = pool.submit(decode_to_shared, raw, block.name, query_box, area, selection)
+            except BaseException:
+                block.close()
+                block.unlink()
+                raise
+            pending[future] = (key, header, block, len(raw), retries)
+
+            # Hand back what is already decoded; wait on the pool only when
+            # the decode window is full
+            done = [f for f in pending if f.done()]
+            if not done and len(pending) >= limit:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = collect(future)
+                if node is not None:
+                    yield node
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = collect(future)
+                if node is not None:
+                    yield node
+    finally:
+        for future, (_, _, block, _, _) in pending.items():
+            future.cancel()
+            block.close()
+            block.unlink()
+
+
+# ---------------------------------------------------------------------------
+# Main Download Function
+# ---------------------------------------------------------------------------
+
+def open_tile_writer(path: Path, header):
+    """
+    Open the writer for a tile in config.OUTPUT_FORMAT: a COPC writer, or a
+    LAZ writer (compressed regardless of file suffix).
+    """
+    if config.OUTPUT_FORMAT == "copc":
+        return CopcWriter(path, header)
+    return laspy.open(
+        str(path),
+        mode="w",
+        header=header,
+        do_compress=True,
+        laz_backend=laspy.LazBackend.LazrsParallel
+    )
+
+
+def abort_tile_writer(writer) -> None:
+    """
+    Drop a tile writer after an error without masking it: a COPC writer
+    discards its buffered points unwritten, and a LAZ writer is closed
+    (the caller deletes the file) with any error from closing ignored.
+    """
+    if isinstance(writer, CopcWriter):
+        writer.abort()
+        return
+    try:
+        writer.close()
+    except Exception:
+        pass
+
+
+def stream_tile(base_url: str, nodes: list, query_box: tuple, tmp_path: Path, area=None) -> None:
+    """
+    Download, filter, and write nodes to tmp_path as they arrive.
+
+    Nodes are fetched and decoded concurrently (see decode_nodes) and
+    written in completion order. The writer is opened with the header of the first node that has ground
+    points; all EPT nodes of a dataset share one scale/offset.
+    """
+    writer = None
+    try:
+        for key, header, ground_points, n_bytes, retries in decode_nodes(base_url, nodes, query_box, area):
+            if len(ground_points) == 0:
+                continue
+
+            if writer is None:
+                writer = open_tile_writer(tmp_path, header)
+            writer.write_points(ground_points)
+    except BaseException:
+        if writer is not None:
+            abort_tile_writer(writer)
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    if writer is None:
         raise ValueError(
             "No ground points found in this tile after filtering. "
             "The tile may be empty or outside the dataset extent."
         )
+    writer.close()
 
-    # --- Step 6: Write filtered points as LAZ ---
-    filtered = laspy.LasData(header=header)
-    filtered.points = final_points
 
-    with laspy.open(
-        filename,
-        mode="w",
-        header=filtered.header,
-        laz_backend=laspy.LazBackend.LazrsParallel
-    ) as writer:
-        writer.write_points(filtered.points)
+def spool_dir_for(out_path: Path) -> Path:
+    """Directory holding a tile's spooled per-node parts."""
+    return out_path.parent / ".partial" / out_path.stem
+
+
+def spool_part(spool_dir: Path, key: str, header, points) -> None:
+    """Atomically write one node's filtered points as an uncompressed LAS part."""
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    part_tmp = spool_dir / f"{key}.las.tmp"
+    with laspy.open(str(part_tmp), mode="w", header=header, do_compress=False) as writer:
+        writer.write_points(points)
+    os.replace(part_tmp, spool_dir / f"{key}.las")
+
+
+def done_nodes(ledger: DownloadLedger, tile_name: str, spool_dir: Path) -> set:
+    """Nodes the ledger records as finished whose part (if any) survived."""
+    return {
+        key for key, record in ledger.completed_nodes(tile_name).items()
+        if record["points"] == 0 or (spool_dir / f"{key}.las").exists()
+    }
+
+
+def plan_tile(ledger: DownloadLedger, out_path: Path, query_box: tuple, max_depth, nodes: list) -> None:
+    """
+    Record a new node plan for a tile and delete the parts spooled under
+    its previous plan, whose points may lie outside the new bounds or use
+    another point format (assemble_tile would merge a stale part of any
+    node that is in both plans but not written again).
+    """
+    shutil.rmtree(spool_dir_for(out_path), ignore_errors=True)
+    ledger.plan(out_path.name, query_box, max_depth, nodes)
+
+
+def assemble_tile(spool_dir: Path, nodes: list, tmp_path: Path) -> None:
+    """Compress a tile's spooled parts into tmp_path in plan order."""
+    parts = [spool_dir / f"{key}.las" for key in nodes if (spool_dir / f"{key}.las").exists()]
+    if not parts:
+        raise ValueError(
+            "No ground points found in this tile after filtering. "
+            "The tile may be empty or outside the dataset extent."
+        )
+
+    writer = None
+    try:
+        for part in parts:
+            with laspy.open(str(part)) as reader:
+                if writer is None:
+                    writer = open_tile_writer(tmp_path, reader.header)
+                for chunk in reader.chunk_iterator(1_000_000):
+                    writer.write_points(chunk)
+    except BaseException:
+        if writer is not None:
+            abort_tile_writer(writer)
+        tmp_path.unlink(missing_ok=True)
+        raise
+    writer.close()
+
+
+def publish_tile(tmp_path: Path, out_path: Path, ledger: DownloadLedger = None) -> None:
+    """Rename a finished tile into place and clear its ledger spool."""
+    os.replace(tmp_path, out_path)
+    if ledger is not None:
+        ledger.tile_done(out_path.name)
+        shutil.rmtree(spool_dir_for(out_path), ignore_errors=True)
+
+
+def spool_tile(
+    base_url: str,
+    nodes: list,
+    query_box: tuple,
+    tmp_path: Path,
+    ledger: DownloadLedger,
+    out_path: Path,
+    area=None
+) -> None:
+    """
+    Resumable version of stream_tile.
+
+    Each node's filtered ground points are spooled to an uncompressed LAS
+    part under .partial/<tile>/ and recorded in the ledger, so a restarted
+    run only fetches the nodes that had not finished. Once every node is
+    done the parts are compressed into tmp_path in plan order.
+    """
+    tile_name = out_path.name
+    spool_dir = spool_dir_for(out_path)
+    done = done_nodes(ledger, tile_name, spool_dir)
+    remaining = [key for key in nodes if key not in done]
+
+    # --- Fetch and spool the nodes still missing ---
+    try:
+        for key, header, ground_points, n_bytes, retries in decode_nodes(base_url, remaining, query_box, area):
+            if len(ground_points) > 0:
+                spool_part(spool_dir, key, header, ground_points)
+            ledger.node_done(tile_name, key, n_bytes, retries, len(ground_points))
+    except Exception as e:
+        ledger.node_failed(tile_name, str(e))
+        raise
+
+    # --- Compress the spooled parts into the tile ---
+    assemble_tile(spool_dir, nodes, tmp_path)
+
+
+def tile_area(tile):
+    """A tile's clipping polygon, or None for a plain rectangular tile."""
+    return None if tile.equals(box(*tile.bounds)) else tile
+
+
+def run_download(tile_box, filename: str, ledger: DownloadLedger = None):
+    """
+    Downloads all EPT nodes intersecting tile_box, filters each one to
+    ground points (Classification=2) inside the tile as soon as it is
+    decoded, and writes the survivors to a LAZ file.
+
+    tile_box is a shapely box, or a tile clipped to a non-rectangular study
+    area (see load_study_area); in that case nodes and points outside the
+    clipped polygon are skipped as well.
+
+    The tile is written under a temporary name and renamed into place only
+    when complete, so an existing output file is always a finished tile.
+    Points are streamed straight into the writer, so peak memory is the
+    decode window (two nodes per decode worker) plus the writer's
+    compression buffer. With a ledger and config.DOWNLOAD_SPOOL, or when
+    an earlier run left this tile part-spooled, node progress is spooled
+    instead (see spool_tile) so an interrupted tile resumes without
+    re-fetching finished nodes.
+    """
+    b = tile_box.bounds  # (minx, miny, maxx, maxy)
+    query_box = (b[0], b[1], b[2], b[3])
+    area = tile_area(tile_box)
+    base_url = ept_base_url(config.EPT_URL)
+
+    out_path = Path(filename)
+    tmp_path = out_path.with_name(out_path.name + ".part")
+    tile_name = out_path.name
+
+    # --- Step 1: Load EPT metadata ---
+    # Comes from the process-wide cache after the first tile.
+    ept_info = fetch_json_cached(config.EPT_URL)
+    ept_bounds = ept_info["bounds"]  # [minx, miny, minz, maxx, maxy, maxz]
+
+    # Only depths needed for the requested resolution (config.RES)
+    max_depth = depth_for_resolution(ept_info, config.RES)
+
+    # --- Step 2: Find all nodes that intersect our tile ---
+    # A resumed tile reuses the node list recorded in the ledger.
+    nodes = None
+    if ledger is not None:
+        nodes = ledger.planned_nodes(tile_name, query_box, max_depth)
+
+    if nodes is None:
+        hierarchy = get_hierarchy(base_url)
+        nodes = collect_nodes(hierarchy, ept_bounds, query_box, base_url, max_depth, area)
+
+        if not nodes:
+            raise ValueError(
+                f"No EPT nodes found intersecting bounds {query_box}. "
+                "Check that BOUNDS_STR in config.py is within the dataset extent."
+            )
+        if ledger is not None:
+            plan_tile(ledger, out_path, query_box, max_depth, nodes)
+
+    # --- Step 3: Download, filter, and write nodes ---
+    spool = ledger is not None and (
+        config.DOWNLOAD_SPOOL or done_nodes(ledger, tile_name, spool_dir_for(out_path))
+    )
+    if spool:
+        spool_tile(base_url, nodes, query_box, tmp_path, ledger, out_path, area)
+    else:
+        stream_tile(base_url, nodes, query_box, tmp_path, area)
+
+    # --- Step 4: Publish the finished tile ---
+    publish_tile(tmp_path, out_path, ledger)
+
+
+def run_node_download(tiles: list, out_paths: list, ledger: DownloadLedger) -> None:
+    """
+    Node-centric download of a whole tile set.
+
+    Plans every node needed for the union of the tiles up front, downloads
+    each node exactly once, and routes its ground points into every tile
+    (core plus overlap) it falls in. Points are bucketed per tile as spooled
+    parts, with the same layout and ledger records as spool_tile, so the
+    run is resumable and a tile written here is identical to one written by
+    run_download.
+
+    Nodes are processed in order of their western edge. A tile is complete
+    once every node west of its eastern edge has been processed, so tiles
+    are compressed and published as a sweep line crosses the study area and
+    only a band of tiles is ever held in the spool.
+
+    A node that fails for good (after DOWNLOAD_RETRIES) is recorded in the
+    ledger and the sweep carries on; the tiles it belongs to are not
+    published, keep their spooled parts, and are reported at the end, so
+    the next run fetches only their missing nodes.
+    """
+    base_url = ept_base_url(config.EPT_URL)
+    ept_info = fetch_json_cached(config.EPT_URL)
+    ept_bounds = ept_info["bounds"]
+    max_depth = depth_for_resolution(ept_info, config.RES)
+    hierarchy = get_hierarchy(base_url)
+
+    # --- Step 1: Plan the full node set for the study area ---
+    todo = [i for i, path in enumerate(out_paths) if not path.exists()]
+    if not todo:
+        print("All tiles already exist.")
+        return
+
+    tile_boxes = np.array([tiles[i].bounds for i in todo])  # (minx, miny, maxx, maxy)
+    study_box = (
+        tile_boxes[:, 0].min(), tile_boxes[:, 1].min(),
+        tile_boxes[:, 2].max(), tile_boxes[:, 3].max()
+    )
+    # Tiles clipped to a non-rectangular study area also prune by polygon
+    areas = {i: tile_area(tiles[i]) for i in todo}
+    study_area = None
+    if any(area is not None for area in areas.values()):
+        study_area = shapely.union_all([tiles[i] for i in todo])
+        for area in areas.values():
+            if area is not None:
+                shapely.prepare(area)
+
+    print(f"Planning nodes for {len(todo)} tiles...", end="", flush=True)
+    all_nodes = collect_nodes(hierarchy, ept_bounds, study_box, base_url, max_depth, study_area)
+
+    # --- Step 2: Route every node to the tiles it overlaps ---
+    node_boxes = address_bounds(ept_bounds, key_addresses(all_nodes))
+    node_tiles = {}
+    tile_nodes = {}
+    for row, i in enumerate(todo):
+        t = tile_boxes[row]
+        hits = np.flatnonzero(
+            (t[0] < node_boxes[:, 2]) & (node_boxes[:, 0] < t[2]) &
+            (t[1] < node_boxes[:, 3]) & (node_boxes[:, 1] < t[3])
+        )
+        if areas[i] is not None and len(hits) > 0:
+            hits = hits[shapely.intersects(areas[i], shapely.box(*node_boxes[hits].T))]
+        tile_nodes[i] = [all_nodes[h] for h in hits]
+        for h in hits:
+            node_tiles.setdefault(all_nodes[h], []).append(i)
+
+    # Record each tile's plan; a tile already planned identically keeps
+    # its completed nodes from an earlier, interrupted run
+    pending = {}
+    for row, i in enumerate(todo):
+        tile_name = out_paths[i].name
+        query_box = tuple(tile_boxes[row])
+        if ledger.planned_nodes(tile_name, query_box, max_depth) != tile_nodes[i]:
+            plan_tile(ledger, out_paths[i], query_box, max_depth, tile_nodes[i])
+        done = done_nodes(ledger, tile_name, spool_dir_for(out_paths[i]))
+        pending[i] = set(tile_nodes[i]) - done
+
+    needed = {key for i in todo for key in pending[i]}
+    order = sorted(needed, key=lambda k: key_bounds(ept_bounds, k)[:2])
+    print(f" {len(all_nodes)} nodes, {len(order)} still to fetch")
+
+    def finish_tile(i):
+        out_path = out_paths[i]
+        tmp_path = out_path.with_name(out_path.name + ".part")
+        try:
+            assemble_tile(spool_dir_for(out_path), tile_nodes[i], tmp_path)
+            publish_tile(tmp_path, out_path, ledger)
+            print(f"  Tile {out_path.name} done ({len(tile_nodes[i])} nodes)")
+        except Exception as e:
+            print(f"  Tile {out_path.name} FAILED. Error: {e}")
+
+    # Tiles whose nodes were all finished before an interruption
+    for i in todo:
+        if not pending[i]:
+            finish_tile(i)
+
+    # --- Step 3: Fetch each node once and scatter its ground points ---
+    failed_nodes = {}  # key -> error
+
+    def node_failed(key, error):
+        failed_nodes[key] = error
+        names = [out_paths[i].name for i in node_tiles[key] if key in pending[i]]
+        ledger.node_failed("(node mode)", str(error), key, names)
+
+    start_time = time.time()
+    try:
+        decoded = decode_nodes(base_url, order, on_error=node_failed)
+        for n, (key, header, points, n_bytes, retries) in enumerate(decoded, start=1):
+            x_coords, y_coords = point_xy(header, points)
+
+            for i in node_tiles[key]:
+                if key not in pending[i]:
+                    continue
+                mask = clip_mask(x_coords, y_coords, tiles[i].bounds, areas[i])
+                n_points = int(mask.sum())
+                if n_points > 0:
+                    spool_part(spool_dir_for(out_paths[i]), key, header, points[mask])
+                ledger.node_done(out_paths[i].name, key, n_bytes, retries, n_points)
+
+                pending[i].discard(key)
+                if not pending[i]:
+                    finish_tile(i)
+
+            finished = n + len(failed_nodes)
+            if finished % 100 == 0 or finished == len(order):
+                elapsed = time.time() - start_time
+                eta_min = (len(order) - finished) / (finished / elapsed) / 60 if elapsed > 0 else 0
+                print(f"  [{finished}/{len(order)}] nodes | {elapsed/60:.1f} min elapsed | ETA {eta_min:.1f} min")
+    except Exception as e:
+        ledger.node_failed("(node mode)", str(e))
+        raise
+
+    # --- Step 4: Report the tiles left incomplete by failed nodes ---
+    if failed_nodes:
+        incomplete = sorted({i for key in failed_nodes for i in node_tiles[key] if key in pending[i]})
+        print(
+            f"  {len(failed_nodes)} node(s) FAILED; {len(incomplete)} tile(s) left for the next run:"
+        )
+        for i in incomplete:
+            keys = sorted(key for key in pending[i] if key in failed_nodes)
+            print(f"    {out_paths[i].name}: {len(keys)} failed node(s), first {keys[0]}: {failed_nodes[keys[0]]}")
+
+
+# ---------------------------------------------------------------------------
+# Tile Planning
+# ---------------------------------------------------------------------------
+
+def tiling_settings(study_area) -> dict:
+    """The config values a tile plan depends on (a change means re-planning)."""
+    settings = {
+        "tiling": config.TILING,
+        "study_area": hashlib.sha1(shapely.to_wkb(study_area)).hexdigest(),
+        "tile_size": config.TILE_SIZE,
+        "overlap": config.OVERLAP,
+        "res": config.RES,
+    }
+    if config.TILING == "balanced":
+        settings.update({
+            "target_points": config.TILE_TARGET_POINTS,
+            "min_size": config.TILE_SIZE_MIN,
+            "max_size": config.TILE_SIZE_MAX,
+        })
+    return settings
+
+
+def study_density(study_area) -> tile_plan.DensityGrid:
+    """
+    Point density over the study area from the EPT hierarchy alone: the
+    point count of every node down to the RES depth, spread over a grid of
+    cells one deepest node wide (see tile_plan.DensityGrid).
+
+    Nodes at the deepest depth whose counts live in their own hierarchy
+    page (count -1) have those pages fetched for the count; their subtrees
+    are not used.
+    """
+    base_url = ept_base_url(config.EPT_URL)
+    ept_info = fetch_json_cached(config.EPT_URL)
+    ept_bounds = ept_info["bounds"]
+    max_depth = depth_for_resolution(ept_info, config.RES)
+    hierarchy = get_hierarchy(base_url)
+
+    nodes = collect_nodes(
+        hierarchy, ept_bounds, study_area.bounds, base_url, max_depth, tile_area(study_area)
+    )
+    paged = [key for key in nodes if hierarchy.get(key) == -1]
+    for key, page in zip(paged, fetch_hierarchy_pages(base_url, paged)):
+        if page and key in page:
+            hierarchy.update(page)
+
+    address = key_addresses(nodes)
+    counts = np.array([max(hierarchy.get(key, 0), 0) for key in nodes], dtype=np.float64)
+    depth = int(address[:, 0].max(initial=0))
+    cell_size = max((ept_bounds[3] - ept_bounds[0]) / 2 ** depth, config.TILE_SIZE_MIN / 8)
+    return tile_plan.DensityGrid(study_area, cell_size, address_bounds(ept_bounds, address), counts)
+
+
+def plan_tiles(study_area) -> list:
+    """
+    Return the tile plan entries ({"name", "bounds", "points"}) for the
+    study area, reusing config.TILE_PLAN if it was made with the current
+    settings and writing a new plan otherwise.
+    """
+    settings = tiling_settings(study_area)
+    tiles = tile_plan.load_plan(config.TILE_PLAN, settings)
+    if tiles is not None:
+        print(f"Tile plan: {config.TILE_PLAN.name} (reused)")
+        return tiles
+    if config.TILE_PLAN.exists():
+        print("Tile plan: settings changed, re-planning (existing tiles keep their old layout)")
+
+    print(f"Planning {config.TILING} tiles from EPT point counts...", end="", flush=True)
+    density = study_density(study_area)
+    if config.TILING == "balanced":
+        target = config.TILE_TARGET_POINTS
+        if not target:
+            # Average core of a TILE_SIZE grid tile
+            step = config.TILE_SIZE - config.OVERLAP
+            target = density.values.sum() * step ** 2 / study_area.area
+        boxes = tile_plan.balanced_tiles(
+            study_area, density, max(target, 1.0),
+            config.TILE_SIZE_MIN, config.TILE_SIZE_MAX, config.OVERLAP
+        )
+    else:
+        boxes = tile_plan.grid_tiles(study_area, config.TILE_SIZE, config.OVERLAP)
+
+    points = [density.box_sum(b) for b in boxes]
+    tile_plan.save_plan(config.TILE_PLAN, settings, boxes, points)
+    print(f" {len(boxes)} tiles")
+    return tile_plan.load_plan(config.TILE_PLAN)
 
 
 # ---------------------------------------------------------------------------
@@ -244,53 +1728,83 @@ if __name__ == "__main__":
     # Verify EPT endpoint is reachable before starting
     print(f"Verifying EPT endpoint: {config.EPT_URL}")
     try:
-        fetch_json(config.EPT_URL)
+        if fetch_json_cached(config.EPT_URL) is None:
+            raise ValueError("ept.json not found (HTTP 404)")
         print("Endpoint OK.")
     except Exception as e:
         print(f"ERROR: Could not reach EPT endpoint. Check EPT_URL in config.py.\n  {e}")
         sys.exit(1)
 
-    # Parse Study Area Bounds
-    clean = config.BOUNDS_STR.replace("(", "").replace(")", "").replace("[", "").replace("]", "")
-    p = [float(x) for x in clean.split(",")]
-    study_area = box(p[0], p[2], p[1], p[3])
-
-    # Generate Overlapping Tiles
-    tiles = []
-    step = config.TILE_SIZE - config.OVERLAP
-
-    x = p[0]
-    while x < p[1]:
-        y = p[2]
-        while y < p[3]:
-            tile = box(x, y, x + config.TILE_SIZE, y + config.TILE_SIZE)
-            clipped_tile = tile.intersection(study_area)
-            tiles.append(clipped_tile)
-            y += step
-        x += step
+    # Study Area: AOI polygon or BOUNDS_STR rectangle
+    study_area = load_study_area()
+    shapely.prepare(study_area)
+
+    # Tile layout (grid or density-balanced), saved for the later stages
+    plan = plan_tiles(study_area)
+    tiles = [box(*entry["bounds"]).intersection(study_area) for entry in plan]
+    tile_points = [entry["points"] for entry in plan]
 
     total = len(tiles)
     mode = "TEST" if config.TEST_RUN else "PRODUCTION"
     print(f"--- {mode} Sync: {total} tiles @ {config.RES}m resolution ---")
+    if config.DOWNLOAD_DIMENSIONS == "xyzc":
+        print(
+            "    DOWNLOAD_DIMENSIONS = \"xyzc\": only X, Y, Z, classification and return numbers are kept.\n"
+            "    Tiles are written in point format 0 (6 for LAS 1.4 sources); their remaining fields "
+            "(intensity, scan angle, user data, point source ID, flags, GPS time) are zeros, as "
+            f"recorded in the {ZEROED_FIELDS_VLR[0]!r} VLR of each tile."
+        )
+    if total:
+        print(
+            f"    Estimated points per tile (all classes): {int(np.median(tile_points)):,} median, "
+            f"{min(tile_points):,} to {max(tile_points):,}"
+        )
+
+    # Node-level progress survives crashes, so interrupted tiles resume
+    ledger = DownloadLedger(config.DOWNLOAD_LEDGER)
+    out_paths = [config.DATA_RAW / f"{entry['name']}.laz" for entry in plan]
 
     start_time = time.time()
-    for i, tile in enumerate(tiles):
-        out_path = config.DATA_RAW / f"gt_{i+1:03}.laz"
+    try:
+        if config.DOWNLOAD_MODE == "node":
+            print("Node-centric mode: each EPT node is fetched once and routed to its tiles")
+            try:
+                run_node_download(tiles, out_paths, ledger)
+            except Exception as e:
+                print(f"Node-centric download FAILED. Error: {e}")
+        else:
+            done_points, done_seconds = 0, 0.0
+            for i, tile in enumerate(tiles):
+                out_path = out_paths[i]
 
-        if out_path.exists():
-            print(f"[{i+1}/{total}] Skipping {out_path.name} (Exists)")
-            continue
+                if out_path.exists():
+                    print(f"[{i+1}/{total}] Skipping {out_path.name} (Exists)")
+                    continue
 
-        tile_start = time.time()
-        print(f"[{i+1}/{total}] Downloading {out_path.name}...", end="", flush=True)
+                tile_start = time.time()
+                print(f"[{i+1}/{total}] Downloading {out_path.name}...", end="", flush=True)
 
-        try:
-            run_download(tile, str(out_path))
-            elapsed = time.time() - tile_start
-            remaining = total - (i + 1)
-            eta_min = (elapsed * remaining) / 60
-            print(f" Done in {elapsed:.1f}s | Est. Remaining: {eta_min:.1f} min")
-        except Exception as e:
-            print(f" FAILED. Error: {e}")
+                try:
+                    run_download(tile, str(out_path), ledger)
+                    elapsed = time.time() - tile_start
 
-    print(f"\nTotal Process Complete in {(time.time() - start_time)/60:.2f} minutes.")
+                    # ETA from the download rate in estimated points, so small
+                    # and large tiles are weighed by their size
+                    done_points += tile_points[i]
+                    done_seconds += elapsed
+                    remaining = sum(
+                        n for n, path in zip(tile_points[i+1:], out_paths[i+1:]) if not path.exists()
+                    )
+                    eta_min = remaining * done_seconds / max(done_points, 1) / 60
+                    print(f" Done in {elapsed:.1f}s | Est. Remaining: {eta_min:.1f} min")
+                except Exception as e:
+                    print(f" FAILED. Error: {e}")
+    finally:
+        # Reported and cleaned up even if the run is interrupted
+        print(f"\nTotal Process Complete in {(time.time() - start_time)/60:.2f} minutes.")
+        print(ledger.summary())
+        print(get_concurrency().summary())
+        if get_node_cache() is not None:
+            print(get_node_cache().summary())
+        ledger.close()
+        shutdown_decode_pool()
@@ -0,0 +1,186 @@
+"""
+bench_download.py
+-----------------
+Benchmarks batchdownload.py offline against the local EPT stand-in
+(ept_standin.py), so concurrency and caching can be tuned without touching
+usgs-lidar-public.
+
+For each concurrency level (fixed, or "auto" for adaptive), two phases are timed in a fresh process with
+cold caches:
+  - collect_nodes : node discovery for the benchmark tile
+  - run_download  : the full tile download (discovery, fetch, filter, write)
+
+Reported per phase: wall time, nodes/s, MB/s (bytes served by the stand-in),
+HTTP requests issued (by type) and throttled, the downloading process's peak RSS, and the
+largest peak RSS among its LAZ decode workers.
+
+USAGE:
+    1. Edit the settings in the CONFIG section below.
+    2. Run: python bench_download.py
+
+Requirements:
+    conda install -c conda-forge laspy lazrs-python numpy requests shapely
+"""
+
+import multiprocessing
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Calculate the path to the project root (one level up from scripts/)
+root_dir = Path(__file__).resolve().parent.parent
+
+# Add the root directory to sys.path so Python can find config.py
+if str(root_dir) not in sys.path:
+    sys.path.append(str(root_dir))
+
+import config
+import ept_standin
+
+# =============================================================================
+# CONFIG — Edit these before running
+# =============================================================================
+
+DATASET_DIR        = ept_standin.DATASET_DIR   # Generated on first run if missing
+LATENCY_MS         = 40           # Simulated per-request latency
+BANDWIDTH_MBPS     = 200          # Simulated link bandwidth (0 = unlimited)
+MAX_RPS            = 0            # Simulated S3 request-rate limit (0 = none)
+
+# In-flight request counts to compare (each is both the starting count and
+# the cap; throttling can still lower it), plus "auto" for the adaptive
+# controller with the limits in config.py
+CONCURRENCY_LEVELS = [1, 4, 8, 16, "auto"]
+
+# Tile to download, (minx, miny, maxx, maxy) in EPSG:3857
+BENCH_TILE         = (-13100000.0, 3980000.0, -13095000.0, 3985000.0)
+
+# =============================================================================
+# END CONFIG — No edits needed below this line
+# =============================================================================
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (NaN if unavailable)."""
+    # Linux: VmHWM is per address space, so unlike ru_maxrss it does not
+    # carry over the parent's peak into a spawned child
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    except (ImportError, AttributeError):
+        return float("nan")
+
+
+def peak_child_rss_mb() -> float:
+    """Largest peak RSS among this process's finished child processes, in MB."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return float("nan")
+
+
+def run_phase(phase: str, ept_url: str, concurrency, work_dir: str) -> dict:
+    """Run one benchmark phase. Executed in a fresh child process."""
+    import batchdownload
+    from shapely.geometry import box
+
+    config.EPT_URL = ept_url
+    if concurrency != "auto":
+        config.DOWNLOAD_CONCURRENCY = concurrency
+        config.DOWNLOAD_CONCURRENCY_MAX = concurrency
+    config.EPT_CACHE_DIR = Path(work_dir) / "ept_cache"
+    config.NODE_CACHE_DIR = Path(work_dir) / "ept_cache" / "nodes"
+
+    base_url = batchdownload.ept_base_url(ept_url)
+    start = time.perf_counter()
+
+    if phase == "collect_nodes":
+        ept_info = batchdownload.fetch_json_cached(ept_url)
+        max_depth = batchdownload.depth_for_resolution(ept_info, config.RES)
+        hierarchy = batchdownload.get_hierarchy(base_url)
+        nodes = batchdownload.collect_nodes(
+            hierarchy, ept_info["bounds"], BENCH_TILE, base_url, max_depth
+        )
+        n_nodes = len(nodes)
+    else:
+        out_path = Path(work_dir) / "bench_tile.laz"
+        batchdownload.run_download(box(*BENCH_TILE), str(out_path))
+        cache = batchdownload.get_node_cache()
+        n_nodes = cache.hits + cache.misses if cache is not None else float("nan")
+
+    seconds = time.perf_counter() - start
+
+    # Decode workers must have exited for their peak RSS to be reported
+    batchdownload.shutdown_decode_pool()
+    return {
+        "seconds": seconds,
+        "nodes": n_nodes,
+        "peak_rss_mb": peak_rss_mb(),
+        "worker_rss_mb": peak_child_rss_mb(),
+        "final_concurrency": batchdownload.get_concurrency().current,
+    }
+
+
+def main():
+    dataset_dir = Path(DATASET_DIR)
+    if not (dataset_dir / "ept.json").exists():
+        print(f"Generating synthetic EPT dataset in {dataset_dir}...")
+        ept_standin.generate_dataset(dataset_dir)
+
+    server, stats, ept_url = ept_standin.serve(dataset_dir, 0, LATENCY_MS, BANDWIDTH_MBPS, MAX_RPS)
+    print(
+        f"Stand-in : {ept_url}  ({LATENCY_MS} ms, {BANDWIDTH_MBPS or 'unlimited'} Mbit/s, "
+        f"{MAX_RPS or 'no'} req/s limit)"
+    )
+    print(f"Tile     : {BENCH_TILE}  @ RES={config.RES}")
+    print("-" * 110)
+    print(
+        f"{'phase':<14} {'conc':>4} {'end':>4} {'time s':>8} {'nodes':>6} {'nodes/s':>8} "
+        f"{'MB':>7} {'MB/s':>7} {'reqs':>6} {'hier':>5} {'data':>5} {'503':>5} "
+        f"{'peak MB':>8} {'wkr MB':>7}"
+    )
+
+    # Each phase runs in its own process so caches are cold and peak RSS
+    # belongs to that phase alone
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        for concurrency in CONCURRENCY_LEVELS:
+            for phase in ("collect_nodes", "run_download"):
+                with tempfile.TemporaryDirectory() as work_dir:
+                    stats.reset()
+                    with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+                        result = pool.submit(run_phase, phase, ept_url, concurrency, work_dir).result()
+                    served = stats.snapshot()
+
+                seconds = result["seconds"]
+                mb = served["bytes"] / 1024 ** 2
+                print(
+                    f"{phase:<14} {concurrency:>4} {result['final_concurrency']:>4} "
+                    f"{seconds:>8.2f} {result['nodes']:>6} {result['nodes'] / seconds:>8.1f} "
+                    f"{mb:>7.1f} {mb / seconds:>7.1f} {served['total']:>6} "
+                    f"{served['hierarchy']:>5} {served['data']:>5} {served['throttled']:>5} "
+                    f"{result['peak_rss_mb']:>8.1f} {result['worker_rss_mb']:>7.1f}"
+                )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
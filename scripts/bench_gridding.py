@@ -0,0 +1,144 @@
+"""
+bench_gridding.py
+-----------------
+Benchmarks the gridding module (gridding.py) against the np.add.at /
+np.minimum.at scatter code it replaced in las_to_dem.py, on synthetic
+points over a DEM-tile-sized grid.
+
+For every statistic, each method is timed (best of REPEATS) and its grid is
+checked against the reference: the old scatter code for mean, min and max,
+and np.median / np.percentile per cell (on a subsample of cells) for median
+and percentile.
+
+USAGE:
+    1. Edit the settings in the CONFIG section below.
+    2. Run: python bench_gridding.py
+
+Requirements:
+    conda install -c conda-forge numpy scipy
+"""
+
+import time
+
+import numpy as np
+
+import gridding
+
+# =============================================================================
+# CONFIG — Edit these before running
+# =============================================================================
+
+N_POINTS    = 20_000_000     # Points per benchmark tile
+GRID_SHAPE  = (2500, 2500)   # Rows, cols (a 5 km tile at 2 m)
+PERCENTILE  = 10             # For the percentile statistic
+REPEATS     = 3              # Timings are the best of this many runs
+CHECK_CELLS = 2000           # Cells checked against np.median / np.percentile
+SEED        = 0
+
+# =============================================================================
+# END CONFIG — No edits needed below this line
+# =============================================================================
+
+
+def scatter_mean(idx: np.ndarray, z: np.ndarray, shape: tuple) -> np.ndarray:
+    """The previous las_to_dem.py mean gridding (np.add.at)."""
+    z_sum   = np.zeros(shape[0] * shape[1], dtype=np.float64)
+    z_count = np.zeros(shape[0] * shape[1], dtype=np.int32)
+    np.add.at(z_sum, idx, z)
+    np.add.at(z_count, idx, 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(z_count > 0, z_sum / z_count, np.nan).reshape(shape)
+
+
+def scatter_reduce(idx: np.ndarray, z: np.ndarray, shape: tuple, ufunc, fill: float) -> np.ndarray:
+    """Min or max gridding in the same style (np.minimum.at / np.maximum.at)."""
+    grid = np.full(shape[0] * shape[1], fill)
+    ufunc.at(grid, idx, z)
+    grid[grid == fill] = np.nan
+    return grid.reshape(shape)
+
+
+def sampled_reference(idx: np.ndarray, z: np.ndarray, cells: np.ndarray, fn) -> np.ndarray:
+    """fn(z of the cell) for a few cells, the slow obvious way."""
+    order = np.argsort(idx, kind="stable")
+    sorted_idx = idx[order]
+    lo = np.searchsorted(sorted_idx, cells, side="left")
+    hi = np.searchsorted(sorted_idx, cells, side="right")
+    return np.array([fn(z[order[a:b]]) if b > a else np.nan for a, b in zip(lo, hi)])
+
+
+def best_time(fn, *args) -> tuple:
+    """(best seconds of REPEATS runs, result of the last run)."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def max_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Largest absolute difference, requiring NaN in the same cells."""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    if not np.array_equal(np.isnan(a), np.isnan(b)):
+        return float("inf")
+    both = ~np.isnan(a)
+    return float(np.abs(a[both] - b[both]).max(initial=0.0))
+
+
+def main():
+    rng = np.random.default_rng(SEED)
+    nrows, ncols = GRID_SHAPE
+    resolution = 2.0
+
+    # Terrain-like elevations over the grid, some cells left empty
+    x = rng.random(N_POINTS) * ncols * resolution
+    y = rng.random(N_POINTS) * nrows * resolution
+    z = 1500 + 200 * np.sin(x / 900) * np.cos(y / 700) + rng.normal(0, 0.3, N_POINTS)
+    idx = gridding.cell_indices(x, y, 0.0, nrows * resolution, resolution, GRID_SHAPE)
+
+    check_cells = rng.choice(nrows * ncols, CHECK_CELLS, replace=False)
+
+    print(f"Points : {N_POINTS:,}  |  Grid: {nrows} x {ncols}  |  best of {REPEATS}")
+    print("-" * 72)
+    print(f"{'statistic':<12} {'method':<22} {'time s':>8} {'Mpts/s':>8} {'speedup':>8} {'max diff':>10}")
+
+    def report(statistic, method, seconds, baseline, diff):
+        speedup = f"{baseline / seconds:>7.1f}x" if baseline else f"{'-':>8}"
+        print(
+            f"{statistic:<12} {method:<22} {seconds:>8.2f} {N_POINTS / seconds / 1e6:>8.1f} "
+            f"{speedup} {diff:>10.2e}"
+        )
+
+    # --- Statistics with a scatter-update baseline ---
+    cases = [
+        ("mean", lambda: scatter_mean(idx, z, GRID_SHAPE), "np.add.at",
+         lambda: gridding.grid_mean(idx, z, GRID_SHAPE)),
+        ("min", lambda: scatter_reduce(idx, z, GRID_SHAPE, np.minimum, np.inf), "np.minimum.at",
+         lambda: gridding.grid_min(idx, z, GRID_SHAPE)),
+        ("max", lambda: scatter_reduce(idx, z, GRID_SHAPE, np.maximum, -np.inf), "np.maximum.at",
+         lambda: gridding.grid_max(idx, z, GRID_SHAPE)),
+    ]
+    for statistic, old_fn, old_name, new_fn in cases:
+        old_seconds, old_grid = best_time(old_fn)
+        new_seconds, new_grid = best_time(new_fn)
+        report(statistic, old_name, old_seconds, None, 0.0)
+        report(statistic, "gridding", new_seconds, old_seconds, max_difference(old_grid, new_grid))
+
+    # --- Order statistics, checked per cell on a sample ---
+    order_cases = [
+        ("median", np.median, lambda: gridding.grid_median(idx, z, GRID_SHAPE)),
+        (f"p{PERCENTILE}", lambda v: np.percentile(v, PERCENTILE),
+         lambda: gridding.grid_percentile(idx, z, GRID_SHAPE, PERCENTILE)),
+    ]
+    for statistic, reference_fn, new_fn in order_cases:
+        new_seconds, new_grid = best_time(new_fn)
+        reference = sampled_reference(idx, z, check_cells, reference_fn)
+        report(statistic, "gridding", new_seconds, None, max_difference(reference, new_grid.ravel()[check_cells]))
+
+    seconds, count = best_time(gridding.grid_count, idx, GRID_SHAPE)
+    report("count", "gridding", seconds, None, float(abs(int(count.sum()) - N_POINTS)))
+
+
+if __name__ == "__main__":
+    main()
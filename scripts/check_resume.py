@@ -0,0 +1,194 @@
+"""
+check_resume.py
+---------------
+Regression check for batchdownload.py's resumable tile downloads, run
+offline against the local EPT stand-in (ept_standin.py).
+
+Resumed tile: a tile is interrupted after its nodes were spooled, then
+restarted with DOWNLOAD_SPOOL = False. It must still resume from the spool,
+fetching no node again, and match a fresh download.
+
+Re-planned tile: a tile is interrupted after its nodes were spooled, then
+downloaded again under different bounds (as after a change to TILE_SIZE in
+config.py). The parts spooled under the old bounds must be discarded, so
+every part assembled into the tile lies within the new bounds and the
+finished tile holds the same points as a fresh download of those bounds.
+
+USAGE:
+    1. Edit the settings in the CONFIG section below.
+    2. Run: python check_resume.py
+       Prints PASS or FAIL for each check; exits with status 1 on a failure.
+
+Requirements:
+    conda install -c conda-forge laspy lazrs-python numpy requests shapely
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import laspy
+import numpy as np
+from shapely.geometry import box
+
+# Calculate the path to the project root (one level up from scripts/)
+root_dir = Path(__file__).resolve().parent.parent
+
+# Add the root directory to sys.path so Python can find config.py
+if str(root_dir) not in sys.path:
+    sys.path.append(str(root_dir))
+
+import config
+import batchdownload
+import ept_standin
+
+# =============================================================================
+# CONFIG — Edit these before running
+# =============================================================================
+
+DATASET_DIR = ept_standin.DATASET_DIR   # Generated on first run if missing
+
+# Tile bounds before and after re-planning, (minx, miny, maxx, maxy) in
+# EPSG:3857; they overlap, so some nodes are in both plans
+OLD_TILE    = (-13099000.0, 3981000.0, -13097000.0, 3983000.0)
+NEW_TILE    = (-13098000.0, 3981000.0, -13096000.0, 3983000.0)
+
+# =============================================================================
+# END CONFIG — No edits needed below this line
+# =============================================================================
+
+
+class Interrupted(Exception):
+    """Stands in for a crash between spooling a tile's nodes and assembling them."""
+
+
+def read_xyz(path: Path) -> np.ndarray:
+    """A tile's integer X, Y, Z records, sorted, so write order does not matter."""
+    las = laspy.read(str(path))
+    xyz = np.column_stack([las.X, las.Y, las.Z])
+    return xyz[np.lexsort(xyz.T[::-1])]
+
+
+def interrupted_download(tile: tuple, out_path: Path, ledger_path: Path) -> None:
+    """Spool every node of a tile with DOWNLOAD_SPOOL on, then "crash" before assembly."""
+    def interrupt(*args):
+        raise Interrupted()
+
+    assemble_tile = batchdownload.assemble_tile
+    ledger = batchdownload.DownloadLedger(ledger_path)
+    config.DOWNLOAD_SPOOL = True
+    batchdownload.assemble_tile = interrupt
+    try:
+        batchdownload.run_download(box(*tile), str(out_path), ledger)
+    except Interrupted:
+        pass
+    finally:
+        batchdownload.assemble_tile = assemble_tile
+        ledger.close()
+
+
+def check_resumed_tile(work_dir: Path) -> list:
+    """Interrupt a tile, finish it with DOWNLOAD_SPOOL off. Returns failures."""
+    failures = []
+    out_path = work_dir / "tile.laz"
+
+    ref_path = work_dir / "reference.laz"
+    batchdownload.run_download(box(*OLD_TILE), str(ref_path))
+
+    interrupted_download(OLD_TILE, out_path, work_dir / "ledger.jsonl")
+    if not any(batchdownload.spool_dir_for(out_path).glob("*.las")):
+        return ["run 1 left no spooled parts, so nothing was tested"]
+
+    ledger = batchdownload.DownloadLedger(work_dir / "ledger.jsonl")
+    config.DOWNLOAD_SPOOL = False
+    try:
+        batchdownload.run_download(box(*OLD_TILE), str(out_path), ledger)
+    finally:
+        ledger.close()
+
+    if ledger.nodes_done:
+        failures.append(f"{ledger.nodes_done} node(s) fetched again instead of read from the spool")
+    if not np.array_equal(read_xyz(out_path), read_xyz(ref_path)):
+        failures.append("tile differs from a fresh download")
+    return failures
+
+
+def check_replanned_tile(work_dir: Path) -> list:
+    """Interrupt a tile under OLD_TILE, finish it under NEW_TILE. Returns failures."""
+    failures = []
+    assemble_tile = batchdownload.assemble_tile
+    out_path = work_dir / "tile.laz"
+    spool_dir = batchdownload.spool_dir_for(out_path)
+
+    # Reference: the new bounds downloaded from scratch
+    ref_path = work_dir / "reference.laz"
+    batchdownload.run_download(box(*NEW_TILE), str(ref_path))
+
+    # --- Run 1: spool every node of the old plan, then "crash" ---
+    interrupted_download(OLD_TILE, out_path, work_dir / "ledger.jsonl")
+    if not any(spool_dir.glob("*.las")):
+        return ["run 1 left no spooled parts, so nothing was tested"]
+
+    # --- Run 2: restart with the new bounds, inspecting the spool on assembly ---
+    def inspect_then_assemble(spool, nodes, tmp_path):
+        for part in sorted(spool.glob("*.las")):
+            las = laspy.read(str(part))
+            if len(las) and (
+                las.x.min() < NEW_TILE[0] or las.y.min() < NEW_TILE[1] or
+                las.x.max() > NEW_TILE[2] or las.y.max() > NEW_TILE[3]
+            ):
+                failures.append(f"part {part.name} holds points outside the new bounds")
+        assemble_tile(spool, nodes, tmp_path)
+
+    ledger = batchdownload.DownloadLedger(work_dir / "ledger.jsonl")
+    config.DOWNLOAD_SPOOL = True
+    batchdownload.assemble_tile = inspect_then_assemble
+    try:
+        batchdownload.run_download(box(*NEW_TILE), str(out_path), ledger)
+    finally:
+        batchdownload.assemble_tile = assemble_tile
+        ledger.close()
+
+    tile, reference = read_xyz(out_path), read_xyz(ref_path)
+    if not np.array_equal(tile, reference):
+        failures.append(
+            f"tile holds {len(tile):,} points, a fresh download of the new bounds {len(reference):,} "
+            "(or the same count with different points)"
+        )
+    return failures
+
+
+def main():
+    dataset_dir = Path(DATASET_DIR)
+    if not (dataset_dir / "ept.json").exists():
+        print(f"Generating synthetic EPT dataset in {dataset_dir}...")
+        ept_standin.generate_dataset(dataset_dir)
+
+    server, stats, ept_url = ept_standin.serve(dataset_dir, 0, 0, 0, 0)
+    failed = False
+    try:
+        checks = [
+            (check_resumed_tile, "part-spooled tile resumes with DOWNLOAD_SPOOL off"),
+            (check_replanned_tile, "re-planned tile discards the old plan's parts"),
+        ]
+        for check, description in checks:
+            with tempfile.TemporaryDirectory() as work_dir:
+                work_dir = Path(work_dir)
+                config.EPT_URL = ept_url
+                config.EPT_CACHE_DIR = work_dir / "ept_cache"
+                config.NODE_CACHE_DIR = work_dir / "ept_cache" / "nodes"
+
+                failures = check(work_dir)
+                print(f"{'FAIL' if failures else 'PASS'}  {description}")
+                for failure in failures:
+                    print(f"        {failure}")
+                failed = failed or bool(failures)
+    finally:
+        batchdownload.shutdown_decode_pool()
+        server.shutdown()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+copc_writer.py
+--------------
+Writes point clouds as COPC (Cloud Optimized Point Cloud) files: LAZ 1.4
+files whose points are organised into an octree, one compressed chunk per
+octree node, with a hierarchy EVLR that maps each node to its chunk.
+
+COPC files are ordinary LAZ files to any LAS reader, but COPC-aware readers
+(e.g. laspy.CopcReader, PDAL readers.copc) can fetch a spatial window or the
+coarse upper levels of the octree without decompressing the whole file:
+
+    with laspy.CopcReader.open("gt_001.laz") as reader:
+        window = reader.query(bounds=..., resolution=...)
+
+laspy can read but not write COPC, so the file layout is produced here with
+laspy's header/VLR serialisation and lazrs's variable-size chunk compressor.
+
+COPC specification: https://copc.io/
+"""
+
+import struct
+
+import laspy
+import lazrs
+import numpy as np
+from laspy.vlrs.known import LasZipVlr
+from laspy.vlrs.vlrlist import VLRList
+
+# Cells per side of each octree node's voxel grid. Each node keeps at most
+# one point per cell; the rest are pushed down to its children.
+SPAN = 128
+
+# A node holding this many points or fewer keeps all of them and becomes a
+# leaf instead of being thinned further.
+MAX_POINTS_PER_NODE = 100_000
+
+# Hard depth limit, reached only by pathological (e.g. duplicate) points
+MAX_DEPTH = 24
+
+# COPC requires LAS 1.4 point formats 6, 7 or 8
+COPC_POINT_FORMAT = {0: 6, 1: 6, 2: 7, 3: 7, 4: 6, 5: 7, 6: 6, 7: 7, 8: 8, 9: 6, 10: 8}
+
+COPC_INFO_SIZE = 160
+EVLR_HEADER_SIZE = 60
+
+
+def build_octree(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    center: np.ndarray,
+    halfsize: float,
+    max_points_per_node: int = MAX_POINTS_PER_NODE
+) -> tuple:
+    """
+    Assign every point to a COPC octree node.
+
+    Works level by level: in each node, the first point that falls in each
+    of the SPAN^3 voxel cells stays at that level and the remainder move on
+    to the next depth, so every level is an evenly thinned version of the
+    cloud. Nodes with at most max_points_per_node remaining points keep them
+    all.
+
+    Returns (order, nodes), where order is a permutation of the points that
+    groups them by node and nodes is a list of (d, x, y, z, start, count)
+    slices into that order.
+    """
+    cube_min = center - halfsize
+    coords = (x - cube_min[0], y - cube_min[1], z - cube_min[2])
+    remaining = np.arange(len(x))
+
+    order_parts = []
+    nodes = []
+    start = 0
+    depth = 0
+
+    while len(remaining) > 0:
+        cells_per_side = 2 ** depth
+        node_size = 2 * halfsize / cells_per_side
+
+        # Node address (x, y, z) of every remaining point at this depth
+        address = [
+            np.clip((c[remaining] // node_size).astype(np.int64), 0, cells_per_side - 1)
+            for c in coords
+        ]
+        node_id = (address[0] * cells_per_side + address[1]) * cells_per_side + address[2]
+        unique_ids, node_rank, counts = np.unique(node_id, return_inverse=True, return_counts=True)
+
+        keep = counts[node_rank] <= max_points_per_node
+        if depth >= MAX_DEPTH:
+            keep[:] = True
+        else:
+            # One point per voxel cell in nodes that are still too full
+            thin = np.flatnonzero(~keep)
+            cell = node_size / SPAN
+            voxel = [
+                np.clip(
+                    ((c[remaining[thin]] - a[thin] * node_size) // cell).astype(np.int64),
+                    0, SPAN - 1
+                )
+                for c, a in zip(coords, address)
+            ]
+            voxel_key = (
+                node_rank[thin].astype(np.int64) * SPAN ** 3 +
+                (voxel[0] * SPAN + voxel[1]) * SPAN + voxel[2]
+            )
+            _, first = np.unique(voxel_key, return_index=True)
+            keep[thin[first]] = True
+
+        # Group the points kept at this depth by node
+        kept = np.flatnonzero(keep)
+        kept = kept[np.argsort(node_rank[kept], kind="stable")]
+        kept_ranks, kept_counts = np.unique(node_rank[kept], return_counts=True)
+        order_parts.append(remaining[kept])
+
+        for rank, count in zip(kept_ranks, kept_counts):
+            nid = int(unique_ids[rank])
+            nz = nid % cells_per_side
+            ny = (nid // cells_per_side) % cells_per_side
+            nx = nid // (cells_per_side * cells_per_side)
+            nodes.append((depth, nx, ny, nz, start, int(count)))
+            start += int(count)
+
+        remaining = remaining[~keep]
+        depth += 1
+
+    return np.concatenate(order_parts), nodes
+
+
+def write_copc(path, header: laspy.LasHeader, points) -> None:
+    """
+    Write points (a laspy point record sharing header's scales/offsets) to
+    path as a COPC file. Points in LAS point formats other than 6, 7 and 8
+    are converted to the nearest COPC-compatible format.
+    """
+    las = laspy.LasData(header=header, points=points)
+    target_format = COPC_POINT_FORMAT[header.point_format.id]
+    if header.point_format.id != target_format or str(header.version) != "1.4":
+        las = laspy.convert(las, point_format_id=target_format, file_version="1.4")
+
+    header = las.header
+    header.global_encoding.wkt = True
+    header.update(las.points)
+
+    x = np.asarray(las.x)
+    y = np.asarray(las.y)
+    z = np.asarray(las.z)
+
+    # --- Octree cube enclosing every point ---
+    mins = np.array([x.min(), y.min(), z.min()])
+    maxs = np.array([x.max(), y.max(), z.max()])
+    center = (mins + maxs) / 2
+    halfsize = max(float((maxs - mins).max()) / 2, 1.0)
+    spacing = 2 * halfsize / SPAN
+
+    order, nodes = build_octree(x, y, z, center, halfsize)
+    ordered = las.points.array[order]
+
+    # --- Header and VLRs (COPC info must be the first VLR) ---
+    laz_vlr = lazrs.LazVlr.new_for_compression(
+        header.point_format.id, header.point_format.num_extra_bytes, True
+    )
+    copc_info = laspy.VLR("copc", 1, "COPC info VLR", bytes(COPC_INFO_SIZE))
+    other_vlrs = [
+        vlr for vlr in header.vlrs
+        if not isinstance(vlr, LasZipVlr) and vlr.user_id != "copc"
+    ]
+    header.vlrs = VLRList([copc_info, LasZipVlr(laz_vlr.record_data())] + other_vlrs)
+    header.are_points_compressed = True
+
+    with open(path, "w+b") as dest:
+        header.write_to(dest)
+        point_start = dest.tell()
+
+        # --- Points: one LAZ chunk per octree node ---
+        compressor = lazrs.LasZipCompressor(dest, laz_vlr)
+        for i, (_, _, _, _, start, count) in enumerate(nodes):
+            compressor.compress_many(np.frombuffer(ordered[start:start + count].tobytes(), np.uint8))
+            if i < len(nodes) - 1:
+                compressor.finish_current_chunk()
+        compressor.done()
+
+        dest.seek(point_start)
+        chunk_table = lazrs.read_chunk_table(dest, laz_vlr)
+        chunk_offsets = point_start + 8 + np.concatenate(
+            [[0], np.cumsum([byte_count for _, byte_count in chunk_table])[:-1]]
+        )
+
+        # --- Hierarchy EVLR: one root page listing every node ---
+        page = b"".join(
+            struct.pack("<iiiiQii", d, nx, ny, nz, int(offset), int(byte_count), count)
+            for (d, nx, ny, nz, _, count), offset, (_, byte_count)
+            in zip(nodes, chunk_offsets, chunk_table)
+        )
+        dest.seek(0, 2)
+        evlr_start = dest.tell()
+        VLRList([laspy.VLR("copc", 1000, "EPT hierarchy", page)]).write_to(
+            dest, as_extended=True
+        )
+
+        # --- Rewrite the header now that offsets are known ---
+        gps_min = gps_max = 0.0
+        if "gps_time" in las.point_format.dimension_names and len(las.points) > 0:
+            gps_min = float(las.gps_time.min())
+            gps_max = float(las.gps_time.max())
+
+        copc_info.record_data = struct.pack(
+            "<5d2Q2d11Q",
+            center[0], center[1], center[2], halfsize, spacing,
+            evlr_start + EVLR_HEADER_SIZE, len(page),
+            gps_min, gps_max,
+            *([0] * 11)
+        )
+        header.start_of_first_evlr = evlr_start
+        header.number_of_evlrs = 1
+        dest.seek(0)
+        header.write_to(dest, ensure_same_size=True)
+
+
+class CopcWriter:
+    """
+    Writer with the write_points()/close() interface of laspy.LasWriter.
+
+    COPC orders points by octree node, so nothing can be written until every
+    point is known: points are buffered as they arrive and the file is built
+    on close(). Memory is therefore proportional to the tile's final point
+    count. abort() drops the buffered points without writing anything.
+    """
+
+    def __init__(self, path, header: laspy.LasHeader):
+        self.path = path
+        self.header = header
+        self._arrays = []
+
+    def write_points(self, points) -> None:
+        self._arrays.append(points.array)
+
+    def close(self) -> None:
+        if not self._arrays:
+            return
+        array = np.concatenate(self._arrays)
+        self._arrays = []
+        write_copc(self.path, self.header, laspy.PackedPointRecord(array, self.header.point_format))
+
+    def abort(self) -> None:
+        self._arrays = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -19,9 +19,13 @@ if str(root_dir) not in sys.path:
 
 import config
 
-LAS_FOLDER = config.DATA_PROCESSED
+# Clean the folder the DEM stage reads (see DEM_INPUT in config.py)
+if config.DEM_INPUT == "laz":
+    LAS_FOLDER, PATTERN = config.DATA_RAW, "*.laz"
+else:
+    LAS_FOLDER, PATTERN = config.DATA_PROCESSED, "*.las"
 
-to_delete = [f for f in glob.glob(os.path.join(LAS_FOLDER, "*.las"))
+to_delete = [f for f in glob.glob(os.path.join(LAS_FOLDER, PATTERN))
              if os.path.getsize(f) / 1024 < config.MIN_TILE_SIZE_KB]
 
 print(f"Found {len(to_delete)} files to delete:")
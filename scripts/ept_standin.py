@@ -0,0 +1,370 @@
+"""
+ept_standin.py
+--------------
+Local stand-in for the USGS EPT service, for measuring and regression-testing
+batchdownload.py without touching usgs-lidar-public.
+
+Two parts:
+  - generate_dataset() writes a synthetic EPT dataset to disk: ept.json, a
+    hierarchy split into sub-pages every HIERARCHY_STEP levels (with -1
+    counts, as Entwine writes them), and LAZ nodes holding a rolling terrain
+    surface with mixed classifications (ground, vegetation, buildings,
+    unclassified).
+  - serve() serves such a directory over HTTP with configurable per-request
+    latency, a shared bandwidth cap and an optional request-rate limit
+    (503 SlowDown beyond it), and counts requests and bytes by type
+    (metadata, hierarchy, data).
+
+USAGE:
+    1. Edit the settings in the CONFIG section below.
+    2. Run: python ept_standin.py
+    3. Point config.EPT_URL at the printed URL.
+
+Requirements:
+    conda install -c conda-forge laspy lazrs-python numpy
+"""
+
+import functools
+import http.server
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import laspy
+import numpy as np
+
+# Calculate the path to the project root (one level up from scripts/)
+root_dir = Path(__file__).resolve().parent.parent
+
+# Add the root directory to sys.path so Python can find config.py
+if str(root_dir) not in sys.path:
+    sys.path.append(str(root_dir))
+
+import config
+from copc_writer import build_octree
+
+# =============================================================================
+# CONFIG — Edit these before running
+# =============================================================================
+
+DATASET_DIR    = config.DATA_SCRATCH / "ept_standin"   # Where the synthetic dataset is written
+
+# Synthetic dataset (EPSG:3857, centred on the TEST_RUN bounds)
+ORIGIN         = (-13101000.0, 3979000.0)   # South-west corner of the dataset
+EXTENT         = 7000.0      # Width/height of the covered area in meters
+DENSITY        = 0.1         # Points per square meter, all classes (real data
+                             # is ~1.5; kept low so generation stays quick)
+NODE_CAPACITY  = 20000       # Max points in a node before it is split
+HIERARCHY_STEP = 3           # Start a new hierarchy page every N depths
+SEED           = 0
+
+# Server
+PORT           = 8080
+LATENCY_MS     = 40          # Added delay before every response
+BANDWIDTH_MBPS = 200         # Shared link bandwidth cap (0 = unlimited)
+MAX_RPS        = 0           # Requests/s before answering 503 SlowDown, as
+                             # S3 does under load (0 = never throttle)
+
+# =============================================================================
+# END CONFIG — No edits needed below this line
+# =============================================================================
+
+# Share of points per LAS class in the synthetic cloud
+CLASS_MIX = {1: 0.15, 2: 0.45, 5: 0.35, 6: 0.05}
+
+
+def terrain_height(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Smooth synthetic mountain-and-valley surface (meters)."""
+    return (
+        1500.0
+        + 400.0 * np.sin(x / 900.0) * np.cos(y / 1300.0)
+        + 120.0 * np.sin(x / 230.0 + y / 410.0)
+    )
+
+
+def generate_dataset(
+    out_dir: Path,
+    origin: tuple = ORIGIN,
+    extent: float = EXTENT,
+    density: float = DENSITY,
+    node_capacity: int = NODE_CAPACITY,
+    hierarchy_step: int = HIERARCHY_STEP,
+    seed: int = SEED
+) -> dict:
+    """
+    Write a synthetic EPT dataset to out_dir and return its ept.json.
+
+    Points are laid out in the octree the way Entwine does it: each node
+    keeps an evenly thinned sample of its cube and passes the remainder to
+    its children, so coarse depths hold a low-density copy of the area.
+    """
+    out_dir = Path(out_dir)
+    (out_dir / "ept-data").mkdir(parents=True, exist_ok=True)
+    (out_dir / "ept-hierarchy").mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    # --- Synthetic point cloud ---
+    n = int(extent * extent * density)
+    x = origin[0] + rng.random(n) * extent
+    y = origin[1] + rng.random(n) * extent
+    classification = rng.choice(
+        list(CLASS_MIX), size=n, p=list(CLASS_MIX.values())
+    ).astype(np.uint8)
+    z = terrain_height(x, y) + rng.normal(0.0, 0.15, n)
+    above = classification != 2
+    z[above] += rng.random(above.sum()) * np.where(classification[above] == 1, 2.0, 25.0)
+
+    # --- EPT cube and octree layout ---
+    mins = np.array([x.min(), y.min(), z.min()])
+    maxs = np.array([x.max(), y.max(), z.max()])
+    center = np.floor((mins + maxs) / 2)
+    halfsize = float(np.ceil((maxs - mins).max() / 2)) + 1.0
+    order, nodes = build_octree(x, y, z, center, halfsize, node_capacity)
+
+    scales = [0.01, 0.01, 0.01]
+    offsets = [float(center[0]), float(center[1]), float(center[2])]
+    gps_time = rng.random(n) * 1e6
+    intensity = rng.integers(0, 4096, n).astype(np.uint16)
+
+    hierarchy = {}
+    for d, nx, ny, nz, start, count in nodes:
+        idx = order[start:start + count]
+        header = laspy.LasHeader(point_format=6, version="1.4")
+        header.scales = scales
+        header.offsets = offsets
+        las = laspy.LasData(header)
+        las.x = x[idx]
+        las.y = y[idx]
+        las.z = z[idx]
+        las.classification = classification[idx]
+        las.intensity = intensity[idx]
+        las.gps_time = gps_time[idx]
+        las.return_number = np.ones(count, dtype=np.uint8)
+        las.number_of_returns = np.ones(count, dtype=np.uint8)
+        las.write(str(out_dir / "ept-data" / f"{d}-{nx}-{ny}-{nz}.laz"))
+        hierarchy[(d, nx, ny, nz)] = count
+
+    # --- Hierarchy pages ---
+    # A node at a depth that is a multiple of hierarchy_step roots a new page;
+    # its parent page lists it with a count of -1.
+    pages = {(0, 0, 0, 0): {}}
+    for (d, nx, ny, nz), count in hierarchy.items():
+        page_depth = (d // hierarchy_step) * hierarchy_step
+        shift = d - page_depth
+        page_key = (page_depth, nx >> shift, ny >> shift, nz >> shift)
+        pages.setdefault(page_key, {})[f"{d}-{nx}-{ny}-{nz}"] = count
+        if d > 0 and shift == 0:
+            parent_depth = page_depth - hierarchy_step
+            up = d - parent_depth
+            parent_page = (parent_depth, nx >> up, ny >> up, nz >> up)
+            pages.setdefault(parent_page, {})[f"{d}-{nx}-{ny}-{nz}"] = -1
+
+    for (d, nx, ny, nz), page in pages.items():
+        with open(out_dir / "ept-hierarchy" / f"{d}-{nx}-{ny}-{nz}.json", "w") as f:
+            json.dump(page, f)
+
+    cube = [float(v) for v in (*(center - halfsize), *(center + halfsize))]
+    ept_info = {
+        "bounds": cube,
+        "boundsConforming": [float(v) for v in (*mins, *maxs)],
+        "dataType": "laszip",
+        "hierarchyType": "json",
+        "points": n,
+        "schema": [
+            {"name": "X", "type": "signed", "size": 4, "scale": scales[0], "offset": offsets[0]},
+            {"name": "Y", "type": "signed", "size": 4, "scale": scales[1], "offset": offsets[1]},
+            {"name": "Z", "type": "signed", "size": 4, "scale": scales[2], "offset": offsets[2]},
+            {"name": "Intensity", "type": "unsigned", "size": 2},
+            {"name": "Classification", "type": "unsigned", "size": 1},
+            {"name": "GpsTime", "type": "float", "size": 8},
+        ],
+        "span": 128,
+        "srs": {"authority": "EPSG", "horizontal": "3857", "wkt": ""},
+        "version": "1.0.0",
+    }
+    with open(out_dir / "ept.json", "w") as f:
+        json.dump(ept_info, f)
+    return ept_info
+
+
+# ---------------------------------------------------------------------------
+# HTTP Server
+# ---------------------------------------------------------------------------
+
+class Link:
+    """Shared bandwidth cap: every response's bytes queue on one link."""
+
+    def __init__(self, bytes_per_s: float):
+        self.bytes_per_s = bytes_per_s
+        self._next_free = 0.0
+        self._lock = threading.Lock()
+
+    def transmit(self, n_bytes: int) -> None:
+        if not self.bytes_per_s:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_free)
+            self._next_free = start + n_bytes / self.bytes_per_s
+            wait = self._next_free - now
+        time.sleep(wait)
+
+
+class RateLimit:
+    """Token bucket of requests per second; requests over it are refused."""
+
+    def __init__(self, per_s: float):
+        self.per_s = per_s
+        self._tokens = per_s
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_s, self._tokens + (now - self._last) * self.per_s)
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class StandinStats:
+    """Thread-safe request and byte counters, by request type."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = {"metadata": 0, "hierarchy": 0, "data": 0}
+            self.bytes_sent = 0
+            self.not_found = 0
+            self.throttled = 0
+
+    def record_request(self, kind: str, code: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+            if code == "404":
+                self.not_found += 1
+            elif code == "503":
+                self.throttled += 1
+
+    def record_bytes(self, n_bytes: int) -> None:
+        with self._lock:
+            self.bytes_sent += n_bytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                **self.requests,
+                "total": sum(self.requests.values()),
+                "not_found": self.not_found,
+                "throttled": self.throttled,
+                "bytes": self.bytes_sent,
+            }
+
+
+class StandinHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler with injected latency, bandwidth cap, and counters."""
+
+    def __init__(self, *args, latency_s=0.0, link=None, rate_limit=None, stats=None, **kwargs):
+        self.latency_s = latency_s
+        self.link = link
+        self.rate_limit = rate_limit
+        self.stats = stats
+        super().__init__(*args, **kwargs)
+
+    def _kind(self) -> str:
+        if "/ept-data/" in self.path:
+            return "data"
+        if "/ept-hierarchy/" in self.path:
+            return "hierarchy"
+        return "metadata"
+
+    def do_GET(self):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if self.rate_limit is not None and not self.rate_limit.allow():
+            self.send_error(503, "Slow Down")
+            return
+        super().do_GET()
+
+    def log_request(self, code="-", size="-"):
+        # Called once per response, including 304s and errors
+        if self.stats is not None:
+            self.stats.record_request(self._kind(), str(code))
+
+    def copyfile(self, source, outputfile):
+        sent = 0
+        while True:
+            block = source.read(64 * 1024)
+            if not block:
+                break
+            if self.link is not None:
+                self.link.transmit(len(block))
+            outputfile.write(block)
+            sent += len(block)
+        if self.stats is not None:
+            self.stats.record_bytes(sent)
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+
+def serve(
+    directory: Path,
+    port: int = 0,
+    latency_ms: float = LATENCY_MS,
+    bandwidth_mbps: float = BANDWIDTH_MBPS,
+    max_rps: float = MAX_RPS
+) -> tuple:
+    """
+    Start a threaded HTTP server for an EPT directory in the background.
+    Returns (server, stats, ept_url). Call server.shutdown() to stop it.
+    """
+    stats = StandinStats()
+    link = Link(bandwidth_mbps * 1e6 / 8) if bandwidth_mbps else None
+    handler = functools.partial(
+        StandinHandler,
+        directory=str(directory),
+        latency_s=latency_ms / 1000.0,
+        link=link,
+        rate_limit=RateLimit(max_rps) if max_rps else None,
+        stats=stats
+    )
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ept_url = f"http://127.0.0.1:{server.server_port}/ept.json"
+    return server, stats, ept_url
+
+
+def main():
+    dataset_dir = Path(DATASET_DIR)
+    if not (dataset_dir / "ept.json").exists():
+        print(f"Generating synthetic EPT dataset in {dataset_dir}...")
+        ept_info = generate_dataset(dataset_dir)
+        print(f"  {ept_info['points']:,} points")
+
+    server, stats, ept_url = serve(dataset_dir, PORT, LATENCY_MS, BANDWIDTH_MBPS, MAX_RPS)
+    print(f"Serving {dataset_dir}")
+    print(f"  EPT_URL   : {ept_url}")
+    print(f"  Latency   : {LATENCY_MS} ms")
+    print(f"  Bandwidth : {BANDWIDTH_MBPS or 'unlimited'} Mbit/s")
+    print(f"  Rate limit: {MAX_RPS or 'none'} requests/s")
+    print("Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"  {stats.snapshot()}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
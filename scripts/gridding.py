@@ -0,0 +1,406 @@
+"""
+gridding.py
+-----------
+Per-cell statistics of point values on a regular raster grid, used by
+las_to_dem.py to turn point elevations into DEM cells.
+
+Points are first mapped to linear cell indices (row * ncols + col, with
+row 0 at the top of the raster), and each statistic is a whole-array
+reduction over those indices. Per-point scatter updates (ufunc.at) are
+only used where NumPy runs them buffered: the np.add.at count that
+las_to_dem.py used before, casting a Python int into an int32 grid, takes
+the unbuffered path and was the slowest step of the stage.
+
+  - count, sum, mean : np.bincount, with the values as weights
+  - min, max         : np.minimum/maximum.at on a float64 grid (buffered
+                       since NumPy 1.25); on older NumPy, points sorted by
+                       cell and np.minimum/maximum.reduceat over each
+                       cell's segment
+  - median, percentile : points sorted by cell and value (one sort of a
+                       combined cell/value-rank key), then the order
+                       statistic read from each segment (linear
+                       interpolation, as np.percentile)
+
+Every statistic returns a (nrows, ncols) float64 grid with NaN in cells
+that received no points (count returns int64 counts).
+
+lattice_extent snaps a grid's bounds to a study-wide lattice, so that
+grids of neighbouring tiles share cell boundaries.
+
+Mean, min, max and count can also be accumulated chunk by chunk with a
+GridAccumulator, so a tile never has to be in memory at once; median and
+percentile need every point of a cell together.
+
+fill_voids fills empty cells from the data around them with a push-pull
+pyramid (normalized convolution at halving resolutions), in time and
+memory proportional to the number of cells. Only cells within a maximum
+distance of data, and inside a given region (the tile's point footprint,
+from polygon_mask), are filled.
+
+bench_gridding.py compares these against the np.add.at code they replace.
+"""
+
+import math
+
+import numpy as np
+from scipy import ndimage
+
+STATISTICS = ("mean", "min", "max", "median", "percentile", "count")
+
+# Statistics that GridAccumulator can combine across chunks of points
+STREAMING_STATISTICS = ("mean", "min", "max", "count")
+
+# ufunc.at is buffered (fast) for same-dtype operands from NumPy 1.25 on
+FAST_UFUNC_AT = tuple(int(v) for v in np.__version__.split(".")[:2]) >= (1, 25)
+
+
+def cell_indices(
+    x: np.ndarray,
+    y: np.ndarray,
+    x_min: float,
+    y_max: float,
+    resolution: float,
+    shape: tuple
+) -> np.ndarray:
+    """
+    Linear cell index of every point on a north-up grid whose top-left
+    corner is (x_min, y_max). Points beyond the grid edge are clamped into
+    the edge cells.
+    """
+    nrows, ncols = shape
+    col_idx = np.floor((x - x_min) / resolution).astype(np.int64)
+    row_idx = np.floor((y_max - y) / resolution).astype(np.int64)  # flip Y: top-left origin
+    np.clip(col_idx, 0, ncols - 1, out=col_idx)
+    np.clip(row_idx, 0, nrows - 1, out=row_idx)
+    row_idx *= ncols
+    row_idx += col_idx
+    return row_idx
+
+
+def lattice_extent(bounds: tuple, resolution: float, origin: tuple) -> tuple:
+    """
+    Snap (x_min, y_min, x_max, y_max) outward to the lattice whose cell
+    edges lie at origin + k * resolution. Returns the snapped bounds and
+    the (nrows, ncols) grid shape; points on the top or right edge still
+    fall inside the grid.
+    """
+    x_min, y_min, x_max, y_max = bounds
+    ox, oy = origin
+    col0 = math.floor((x_min - ox) / resolution)
+    col1 = math.floor((x_max - ox) / resolution) + 1
+    row0 = math.floor((y_min - oy) / resolution)
+    row1 = math.floor((y_max - oy) / resolution) + 1
+    snapped = (
+        ox + col0 * resolution, oy + row0 * resolution,
+        ox + col1 * resolution, oy + row1 * resolution,
+    )
+    return snapped, (row1 - row0, col1 - col0)
+
+
+def grid_count(idx: np.ndarray, shape: tuple) -> np.ndarray:
+    """Number of points per cell."""
+    return np.bincount(idx, minlength=shape[0] * shape[1]).reshape(shape)
+
+
+def grid_sum(idx: np.ndarray, values: np.ndarray, shape: tuple) -> np.ndarray:
+    """Sum of the values per cell (0 in empty cells)."""
+    return np.bincount(idx, weights=values, minlength=shape[0] * shape[1]).reshape(shape)
+
+
+def grid_mean(idx: np.ndarray, values: np.ndarray, shape: tuple) -> np.ndarray:
+    """Mean of the values per cell."""
+    count = grid_count(idx, shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, grid_sum(idx, values, shape) / count, np.nan)
+
+
+def _segments(sorted_idx: np.ndarray) -> tuple:
+    """(cells, starts, counts) of the runs of equal values in sorted_idx."""
+    if len(sorted_idx) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    starts = np.flatnonzero(np.diff(sorted_idx)) + 1
+    starts = np.concatenate([[0], starts])
+    counts = np.diff(np.concatenate([starts, [len(sorted_idx)]]))
+    return sorted_idx[starts], starts, counts
+
+
+def _reduce(idx: np.ndarray, values: np.ndarray, shape: tuple, ufunc, fill: float) -> np.ndarray:
+    n_cells = shape[0] * shape[1]
+    values = np.asarray(values, dtype=np.float64)
+    if FAST_UFUNC_AT:
+        grid = np.full(n_cells, fill)
+        ufunc.at(grid, idx, values)
+        grid[np.bincount(idx, minlength=n_cells) == 0] = np.nan
+        return grid.reshape(shape)
+
+    order = np.argsort(idx)
+    cells, starts, _ = _segments(idx[order])
+    grid = np.full(n_cells, np.nan)
+    if len(cells) > 0:
+        grid[cells] = ufunc.reduceat(values[order], starts)
+    return grid.reshape(shape)
+
+
+def grid_min(idx: np.ndarray, values: np.ndarray, shape: tuple) -> np.ndarray:
+    """Minimum of the values per cell."""
+    return _reduce(idx, values, shape, np.minimum, np.inf)
+
+
+def grid_max(idx: np.ndarray, values: np.ndarray, shape: tuple) -> np.ndarray:
+    """Maximum of the values per cell."""
+    return _reduce(idx, values, shape, np.maximum, -np.inf)
+
+
+def grid_percentile(idx: np.ndarray, values: np.ndarray, shape: tuple, q: float) -> np.ndarray:
+    """
+    q-th percentile (0-100) of the values per cell, interpolated linearly
+    between the two nearest ranks like np.percentile's default method.
+    """
+    n = len(values)
+    if n < 2 ** 32:
+        # Sort once on cell * 2^32 + rank of the value, much faster than
+        # np.lexsort on the two columns
+        by_value = np.argsort(values)
+        rank = np.empty(n, dtype=np.int64)
+        rank[by_value] = np.arange(n)
+        key = (idx.astype(np.int64) << 32) | rank
+        key.sort()
+        sorted_idx = key >> 32
+        sorted_values = values[by_value][key & 0xFFFFFFFF]
+    else:
+        order = np.lexsort((values, idx))
+        sorted_idx, sorted_values = idx[order], values[order]
+    cells, starts, counts = _segments(sorted_idx)
+
+    position = (counts - 1) * (q / 100.0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    low_value = sorted_values[starts + lower]
+    high_value = sorted_values[starts + upper]
+
+    grid = np.full(shape[0] * shape[1], np.nan)
+    grid[cells] = low_value + (high_value - low_value) * (position - lower)
+    return grid.reshape(shape)
+
+
+def grid_median(idx: np.ndarray, values: np.ndarray, shape: tuple) -> np.ndarray:
+    """Median of the values per cell."""
+    return grid_percentile(idx, values, shape, 50.0)
+
+
+def grid_statistic(
+    idx: np.ndarray,
+    values: np.ndarray,
+    shape: tuple,
+    statistic: str,
+    percentile: float = None
+) -> np.ndarray:
+    """Dispatch to the grid_* function named by statistic (see STATISTICS)."""
+    if statistic == "mean":
+        return grid_mean(idx, values, shape)
+    if statistic == "min":
+        return grid_min(idx, values, shape)
+    if statistic == "max":
+        return grid_max(idx, values, shape)
+    if statistic == "median":
+        return grid_median(idx, values, shape)
+    if statistic == "percentile":
+        if percentile is None:
+            raise ValueError("statistic 'percentile' needs a percentile (0-100)")
+        return grid_percentile(idx, values, shape, percentile)
+    if statistic == "count":
+        return grid_count(idx, shape)
+    raise ValueError(f"Unknown grid statistic {statistic!r}; expected one of {STATISTICS}")
+
+
+class GridAccumulator:
+    """
+    Running per-cell statistic over chunks of points, for the statistics in
+    STREAMING_STATISTICS. Holds a count grid plus one value grid, so memory
+    depends on the grid size only, not on the number of points added.
+    """
+
+    def __init__(self, shape: tuple, statistic: str):
+        if statistic not in STREAMING_STATISTICS:
+            raise ValueError(
+                f"Grid statistic {statistic!r} cannot be accumulated in chunks; "
+                f"expected one of {STREAMING_STATISTICS}"
+            )
+        self.shape = shape
+        self.statistic = statistic
+        n_cells = shape[0] * shape[1]
+        self.count = np.zeros(n_cells, dtype=np.int64)
+        self.value = None
+        if statistic == "mean":
+            self.value = np.zeros(n_cells)
+        elif statistic == "min":
+            self.value = np.full(n_cells, np.inf)
+        elif statistic == "max":
+            self.value = np.full(n_cells, -np.inf)
+
+    def add(self, idx: np.ndarray, values: np.ndarray) -> None:
+        """Add a chunk of points, given their cell indices and values."""
+        n_cells = len(self.count)
+        self.count += np.bincount(idx, minlength=n_cells)
+        if self.statistic == "mean":
+            self.value += np.bincount(idx, weights=values, minlength=n_cells)
+        elif self.statistic == "min":
+            np.fmin(self.value, grid_min(idx, values, (n_cells, 1)).ravel(), out=self.value)
+        elif self.statistic == "max":
+            np.fmax(self.value, grid_max(idx, values, (n_cells, 1)).ravel(), out=self.value)
+
+    def result(self) -> np.ndarray:
+        """The statistic grid, with NaN in cells that received no points."""
+        if self.statistic == "count":
+            return self.count.reshape(self.shape)
+        empty = self.count == 0
+        if self.statistic == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                grid = self.value / self.count
+        else:
+            grid = self.value.copy()
+        grid[empty] = np.nan
+        return grid.reshape(self.shape)
+
+
+def _halve(a: np.ndarray) -> np.ndarray:
+    """Sums over 2 x 2 blocks (odd edges padded with zeros)."""
+    h, w = a.shape
+    if h % 2 or w % 2:
+        a = np.pad(a, ((0, h % 2), (0, w % 2)))
+    return a.reshape(a.shape[0] // 2, 2, a.shape[1] // 2, 2).sum(axis=(1, 3))
+
+
+def _double(a: np.ndarray, shape: tuple) -> np.ndarray:
+    """Bilinear upsampling of a to shape, for a grid of half its resolution."""
+    for axis, n in enumerate(shape):
+        position = (np.arange(n) + 0.5) / 2 - 0.5
+        lower = np.floor(position)
+        frac = (position - lower).astype(a.dtype)
+        i0 = np.clip(lower.astype(np.int64), 0, a.shape[axis] - 1)
+        i1 = np.minimum(i0 + 1, a.shape[axis] - 1)
+        frac = frac.reshape((-1, 1) if axis == 0 else (1, -1))
+        a = np.take(a, i0, axis=axis) * (1 - frac) + np.take(a, i1, axis=axis) * frac
+    return a
+
+
+def push_pull(grid: np.ndarray) -> np.ndarray:
+    """
+    Fill every NaN cell of grid by push-pull interpolation (float32).
+
+    Push: the data (weight 1) and empty cells (weight 0) are summed over
+    2 x 2 blocks level by level down to a single cell, each level keeping
+    the weighted mean value and the weight capped at 1. Pull: from the
+    coarsest level back up, each cell keeps its own value to the extent of
+    its weight and takes the rest from the bilinearly upsampled level
+    below, so empty cells get values from the nearest scale that has data.
+    """
+    weight = (~np.isnan(grid)).astype(np.float32)
+    value = np.where(weight > 0, grid, 0).astype(np.float32)   # weight * value
+
+    levels = [(value, weight)]
+    while value.shape[0] > 1 or value.shape[1] > 1:
+        value, weight = _halve(value), _halve(weight)
+        capped = np.minimum(weight, 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            value = np.where(weight > 0, value / weight * capped, 0).astype(np.float32)
+        weight = capped
+        levels.append((value, weight))
+
+    value, weight = levels.pop()
+    while levels:
+        fine_value, fine_weight = levels.pop()
+        up_value = _double(value, fine_value.shape)
+        up_weight = _double(weight, fine_value.shape)
+        value = fine_value + (1 - fine_weight) * up_value
+        weight = fine_weight + (1 - fine_weight) * up_weight
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weight > 0, value / weight, np.nan)
+
+
+def polygon_mask(
+    xs: np.ndarray,
+    ys: np.ndarray,
+    x_min: float,
+    y_max: float,
+    resolution: float,
+    shape: tuple
+) -> np.ndarray:
+    """
+    Cells of a north-up grid (top-left corner at (x_min, y_max)) whose
+    centres lie inside the polygon ring xs, ys, by the even-odd rule: for
+    each row, where its centre line crosses the ring edges.
+    """
+    nrows, ncols = shape
+    x1, y1 = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    yc = (y_max - (np.arange(nrows) + 0.5) * resolution)[:, None]
+
+    # Crossing of every row with every edge, as a fractional column
+    crosses = (y1 <= yc) != (y2 <= yc)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = x1 + (yc - y1) * (x2 - x1) / (y2 - y1)
+    # (ring edges cross each row line an even number of times; rows get
+    # padded with crossings past the last column)
+    col = np.where(crosses, np.ceil((x - x_min) / resolution - 0.5), ncols)
+    if col.shape[1] % 2:
+        col = np.column_stack([col, np.full(nrows, ncols)])
+    col = np.clip(col, 0, ncols)
+    col.sort(axis=1)
+
+    # Inside between the 1st and 2nd crossing, 3rd and 4th, ...: +1 / -1
+    # marks in a difference array, then a running sum along each row
+    starts, ends = col[:, 0::2], col[:, 1::2]
+    rows = np.broadcast_to(np.arange(nrows)[:, None], starts.shape)
+    valid = ends > starts
+    width = ncols + 1
+    marks = np.bincount(
+        np.concatenate([(rows * width + starts)[valid], (rows * width + ends)[valid]]).astype(np.int64),
+        weights=np.concatenate([np.ones(valid.sum()), -np.ones(valid.sum())]),
+        minlength=nrows * width
+    )
+    return marks.reshape(nrows, width).cumsum(axis=1)[:, :ncols] > 0.5
+
+
+def fill_voids(grid: np.ndarray, max_distance: float, region: np.ndarray = None) -> np.ndarray:
+    """
+    Copy of grid with its NaN cells filled by push_pull, where they are at
+    most max_distance cells from a data cell and inside region (a boolean
+    mask; everywhere if None). Other empty cells stay NaN.
+    """
+    empty = np.isnan(grid)
+    if not empty.any() or empty.all():
+        return grid.copy()
+    target = empty.copy() if region is None else empty & region
+
+    # Every cell of an empty region (4-connected, so bounded by data cells
+    # unless it reaches the grid edge) at most 2 * max_distance - 1 cells
+    # across, so of any region with no more cells than that, is within
+    # max_distance of data; the distance transform is only needed around
+    # larger regions and those reaching the edge, within max_distance of
+    # their bounding box
+    if np.isfinite(max_distance):
+        labels, n_regions = ndimage.label(empty)
+        large = np.bincount(labels.ravel(), minlength=n_regions + 1) > 2 * max_distance - 1
+        large[labels[0]] = large[labels[-1]] = large[labels[:, 0]] = large[labels[:, -1]] = True
+        large[0] = False
+        large &= np.bincount(labels[target], minlength=n_regions + 1) > 0   # with cells to fill
+        margin = int(math.ceil(max_distance)) + 1
+        nrows, ncols = grid.shape
+        regions = ndimage.find_objects(np.where(large[labels], labels, 0))
+        for label, found in enumerate(regions, start=1):
+            if found is None:
+                continue
+            rows, cols = found
+            window = (slice(max(rows.start - margin, 0), min(rows.stop + margin, nrows)),
+                      slice(max(cols.start - margin, 0), min(cols.stop + margin, ncols)))
+            too_far = ndimage.distance_transform_edt(empty[window]) > max_distance
+            target[window] &= ~(too_far & (labels[window] == label))
+        del labels
+
+    filled = grid.copy()
+    if target.any():
+        filled[target] = push_pull(grid)[target]
+    return filled
@@ -2,6 +2,11 @@
 las_to_dem.py
 -------------
 Batch rasterizes LAS/LAZ tiles to GeoTIFF DEMs using laspy, scipy, and rasterio.
+By default (config.DEM_INPUT = "laz") the downloaded LAZ tiles are read
+directly and decompressed in-process on all cores, with no LAS extraction.
+With WORKERS > 1 (or None) tiles are rasterized in parallel worker
+processes instead, largest first, and a tile is only started while the
+estimated memory of the running tiles leaves room for it.
 Reprojects point coordinates from EPSG:3857 (WGS84 Pseudo-Mercator) to
 EPSG:26911 (NAD83 / UTM Zone 11N) before gridding, so output DEMs are
 in a metric projection suitable for geomorphic analysis.
@@ -17,8 +22,12 @@ Requirements:
 """
 
 import logging
+import logging.handlers
+import multiprocessing
+import os
 import sys
 import time
+from functools import partial
 from pathlib import Path
 
 import numpy as np
@@ -27,7 +36,6 @@ import rasterio
 from rasterio.transform import from_bounds
 from rasterio.crs import CRS
 from pyproj import Transformer
-from scipy.spatial import cKDTree
 
 # Calculate the path to the project root (one level up from scripts/)
 root_dir = Path(__file__).resolve().parent.parent
@@ -37,28 +45,70 @@ if str(root_dir) not in sys.path:
     sys.path.append(str(root_dir))
 
 import config
+import tile_plan
+from gridding import (
+    STREAMING_STATISTICS, GridAccumulator, cell_indices, fill_voids, grid_statistic, lattice_extent,
+    polygon_mask
+)
+from scheduler import LargestFirstScheduler, choose_workers, tile_cost
 
 # =============================================================================
 # CONFIG — Edit these before running
 # =============================================================================
 
-INPUT_DIR     = config.DATA_PROCESSED      # Folder containing .las or .laz files
+INPUT_DIR     = config.DATA_RAW if config.DEM_INPUT == "laz" else config.DATA_PROCESSED
+                                           # Folder containing .las or .laz files
 OUTPUT_DIR    = config.DATA_SCRATCH_DEMS   # Folder for output GeoTIFFs
 
 INPUT_CRS     = "EPSG:3857"   # Source CRS of the LAS/LAZ files
 OUTPUT_CRS    = "EPSG:26911"  # Target CRS for output GeoTIFFs
                               # EPSG:26911 = NAD83 / UTM Zone 11N (metric, SoCal standard)
 
-RESOLUTION    = 2.0       # Output raster resolution in meters
+RESOLUTION    = config.DEM_RESOLUTION   # Output raster resolution in meters
+GRID_ALIGN    = config.DEM_GRID_ALIGN   # "global" (study-wide lattice) or "tile"
+GRID_ORIGIN   = config.DEM_GRID_ORIGIN  # Lattice origin for GRID_ALIGN = "global"
 NODATA_VALUE  = -9999.0   # NoData fill value
-IDW_POWER     = 2         # IDW distance weighting power for gap filling
-IDW_NEIGHBORS = 8         # Number of nearest neighbors for IDW gap filling
+GRID_STAT     = "mean"    # Cell elevation: mean, min, max, median, or percentile
+GRID_PERCENTILE = 10      # Percentile (0-100) used when GRID_STAT = "percentile"
+CHUNK_POINTS  = 2_000_000 # Points read, reprojected and gridded at a time
+                          # (mean/min/max; median/percentile read whole tiles)
+FILL_MAX_DISTANCE = 100   # Empty cells up to this far (m) from data are filled;
+                          # farther cells and the area outside the tile's
+                          # points stay NoData (None = no limit)
+WORKERS       = None      # Tiles rasterized in parallel processes
+                          # (1 = one at a time in this process; None = one
+                          # per core; tiles start only as memory allows)
 
 # =============================================================================
 # END CONFIG — No edits needed below this line
 # =============================================================================
 
 
+# Only X, Y and Z are gridded. For LAZ point formats 6+ the remaining
+# layers (intensity, GPS time, RGB, ...) are skipped during decompression.
+DEM_LAYERS = laspy.DecompressionSelection.XY_RETURNS_CHANNEL | laspy.DecompressionSelection.Z
+
+# LAZ tiles are decompressed in-process, one LAZ chunk per thread on all
+# cores, when lazrs is installed (otherwise laspy's best available backend)
+LAZ_BACKEND = (
+    laspy.LazBackend.LazrsParallel if laspy.LazBackend.LazrsParallel.is_available() else None
+)
+
+# Peak-memory estimate per tile, for admitting tiles to parallel workers:
+# bytes per point held at once (LAS record, coordinates, reprojected XY,
+# cell index, sort keys) and per grid cell (count, value and result grids,
+# gap-fill arrays, float32 output)
+POINT_BYTES = 100
+CELL_BYTES  = 64
+
+
+class TileLogger(logging.LoggerAdapter):
+    """Prefixes log messages with the tile name, so lines from parallel workers can be told apart."""
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['tile']}] {msg.strip()}", kwargs
+
+
 def setup_logging(output_dir: Path) -> logging.Logger:
     log_path = output_dir / "las_to_dem.log"
     logging.basicConfig(
@@ -73,80 +123,145 @@ def setup_logging(output_dir: Path) -> logging.Logger:
     return logging.getLogger(__name__)
 
 
-def las_to_dem(las_path: Path, out_path: Path, logger: logging.Logger) -> None:
+def init_worker(log_queue) -> None:
     """
-    Reads a LAS/LAZ file, reprojects XY coordinates from INPUT_CRS to
-    OUTPUT_CRS, grids to a DEM using mean gridding with IDW gap fill,
-    and writes a GeoTIFF.
+    Worker-process setup: send all log records to the parent through
+    log_queue (the parent writes them to the log file and stdout), and
+    decompress LAZ on one thread, since the tiles already run one per core.
     """
+    global LAZ_BACKEND
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    if laspy.LazBackend.Lazrs.is_available():
+        LAZ_BACKEND = laspy.LazBackend.Lazrs
 
-    # --- Read LAS/LAZ file ---
-    logger.info(f"  Reading {las_path.name}...")
-    las = laspy.read(str(las_path))
-
-    x = np.array(las.x)
-    y = np.array(las.y)
-    z = np.array(las.z)
-
-    if len(x) == 0:
-        raise RuntimeError("No points found in file")
-
-    logger.info(f"  Points: {len(x):,}  |  Z range: {z.min():.2f} to {z.max():.2f} m")
 
-    # --- Reproject XY from INPUT_CRS to OUTPUT_CRS ---
-    logger.info(f"  Reprojecting {INPUT_CRS} -> {OUTPUT_CRS}...")
-    transformer = Transformer.from_crs(INPUT_CRS, OUTPUT_CRS, always_xy=True)
-    x, y = transformer.transform(x, y)
-
-    logger.info(f"  Reprojected X range: {x.min():.2f} to {x.max():.2f}")
-    logger.info(f"  Reprojected Y range: {y.min():.2f} to {y.max():.2f}")
-
-    # --- Define output grid ---
-    x_min, x_max = x.min(), x.max()
-    y_min, y_max = y.min(), y.max()
-
-    ncols = int(np.ceil((x_max - x_min) / RESOLUTION)) + 1
-    nrows = int(np.ceil((y_max - y_min) / RESOLUTION)) + 1
-
-    col_idx = np.floor((x - x_min) / RESOLUTION).astype(int)
-    row_idx = np.floor((y_max - y) / RESOLUTION).astype(int)  # flip Y: top-left origin
+def tile_memory(las_path: Path) -> int:
+    """
+    Estimated peak bytes for rasterizing a tile, from its header: the grid
+    over its bounds (at RESOLUTION in input units, an overestimate in Web
+    Mercator) plus the points held at once. 0 if the header cannot be
+    read; the tile then fails in its worker and is reported there.
+    """
+    try:
+        with laspy.open(str(las_path)) as reader:
+            header = reader.header
+            n_points = int(header.point_count)
+            width, height = header.maxs[0] - header.mins[0], header.maxs[1] - header.mins[1]
+    except Exception:
+        return 0
+    n_cells = (width / RESOLUTION + 2) * (height / RESOLUTION + 2)
+    if GRID_STAT in STREAMING_STATISTICS:
+        n_points = min(n_points, CHUNK_POINTS)
+    return int(n_cells * CELL_BYTES + n_points * POINT_BYTES)
+
+
+def rasterize_tile(las_path: Path, output_dir: Path) -> float:
+    """Rasterize one tile into output_dir (see las_to_dem) and return the seconds it took."""
+    logger = TileLogger(logging.getLogger(__name__), {"tile": las_path.stem})
+    logger.info(f"START {las_path.name}  (pid {os.getpid()})")
+    tile_start = time.time()
+    las_to_dem(las_path, output_dir / (las_path.stem + ".tif"), logger)
+    return time.time() - tile_start
+
+
+def footprint_ring(transformer: Transformer, mins, maxs, densify: int = 21) -> tuple:
+    """
+    The tile's XY bounds in INPUT_CRS as a ring (xs, ys) in OUTPUT_CRS,
+    each side densified to densify points since reprojected edges curve.
+    """
+    t = np.linspace(0.0, 1.0, densify, endpoint=False)
+    x0, y0, x1, y1 = mins[0], mins[1], maxs[0], maxs[1]
+    xs = np.concatenate([x0 + (x1 - x0) * t, np.full(densify, x1), x1 - (x1 - x0) * t, np.full(densify, x0)])
+    ys = np.concatenate([np.full(densify, y0), y0 + (y1 - y0) * t, np.full(densify, y1), y1 - (y1 - y0) * t])
+    return transformer.transform(xs, ys)
 
-    col_idx = np.clip(col_idx, 0, ncols - 1)
-    row_idx = np.clip(row_idx, 0, nrows - 1)
 
-    # --- Mean gridding ---
-    logger.info(f"  Gridding to {nrows} x {ncols} raster...")
-    z_sum   = np.zeros((nrows, ncols), dtype=np.float64)
-    z_count = np.zeros((nrows, ncols), dtype=np.int32)
+def las_to_dem(las_path: Path, out_path: Path, logger: logging.Logger) -> None:
+    """
+    Reads a LAS/LAZ file, reprojects XY coordinates from INPUT_CRS to
+    OUTPUT_CRS, grids to a DEM (GRID_STAT per cell), fills voids within
+    FILL_MAX_DISTANCE of data, and writes a GeoTIFF.
 
-    np.add.at(z_sum,   (row_idx, col_idx), z)
-    np.add.at(z_count, (row_idx, col_idx), 1)
+    The grid covers the header bounds, reprojected. For mean, min, max and
+    count the points are streamed in CHUNK_POINTS chunks into running
+    grids, so memory depends on the grid size rather than the point count.
+    """
 
-    with np.errstate(invalid="ignore", divide="ignore"):
-        grid = np.where(z_count > 0, z_sum / z_count, np.nan)
+    transformer = Transformer.from_crs(INPUT_CRS, OUTPUT_CRS, always_xy=True)
 
-    # --- IDW gap fill ---
-    empty_mask = np.isnan(grid)
-    n_empty = empty_mask.sum()
+    with laspy.open(
+        str(las_path), decompression_selection=DEM_LAYERS, laz_backend=LAZ_BACKEND
+    ) as reader:
+        header = reader.header
+        if header.point_count == 0:
+            raise RuntimeError("No points found in file")
+
+        logger.info(
+            f"  Points: {header.point_count:,}  |  "
+            f"Z range: {header.mins[2]:.2f} to {header.maxs[2]:.2f} m"
+        )
+
+        # --- Define output grid from the header bounds ---
+        # The tile's XY bounds reprojected to OUTPUT_CRS (edges densified,
+        # since they curve), so the grid is known before any point is read
+        x_min, y_min, x_max, y_max = transformer.transform_bounds(
+            header.mins[0], header.mins[1], header.maxs[0], header.maxs[1], densify_pts=21
+        )
+        footprint = footprint_ring(transformer, header.mins, header.maxs)
+        if GRID_ALIGN == "global":
+            # Snapped outward to the study-wide lattice, so every tile's
+            # cells line up with its neighbours'
+            (x_min, y_min, x_max, y_max), (nrows, ncols) = lattice_extent(
+                (x_min, y_min, x_max, y_max), RESOLUTION, GRID_ORIGIN
+            )
+        else:
+            ncols = int(np.ceil((x_max - x_min) / RESOLUTION)) + 1
+            nrows = int(np.ceil((y_max - y_min) / RESOLUTION)) + 1
+        shape = (nrows, ncols)
+        logger.info(f"  Grid X range: {x_min:.2f} to {x_max:.2f}  ({OUTPUT_CRS})")
+        logger.info(f"  Grid Y range: {y_min:.2f} to {y_max:.2f}  ({OUTPUT_CRS})")
+
+        # --- Reproject and grid ---
+        if GRID_STAT in STREAMING_STATISTICS:
+            # Chunk by chunk into running grids: peak memory is the grids
+            # plus one chunk, whatever the tile's point count
+            logger.info(
+                f"  Reprojecting {INPUT_CRS} -> {OUTPUT_CRS} and gridding to "
+                f"{nrows} x {ncols} raster ({GRID_STAT}, {CHUNK_POINTS:,}-point chunks)..."
+            )
+            accumulator = GridAccumulator(shape, GRID_STAT)
+            for points in reader.chunk_iterator(CHUNK_POINTS):
+                x, y = transformer.transform(np.asarray(points.x), np.asarray(points.y))
+                accumulator.add(
+                    cell_indices(x, y, x_min, y_max, RESOLUTION, shape), np.asarray(points.z)
+                )
+            grid = accumulator.result()
+        else:
+            # Order statistics need every point of a cell at once
+            logger.info(f"  Reading {las_path.name}...")
+            las = reader.read()
+            logger.info(f"  Reprojecting {INPUT_CRS} -> {OUTPUT_CRS}...")
+            x, y = transformer.transform(np.asarray(las.x), np.asarray(las.y))
+            logger.info(f"  Gridding to {nrows} x {ncols} raster ({GRID_STAT})...")
+            cells = cell_indices(x, y, x_min, y_max, RESOLUTION, shape)
+            grid = grid_statistic(cells, np.asarray(las.z), shape, GRID_STAT, GRID_PERCENTILE)
+
+    # --- Void fill ---
+    # Push-pull interpolation (gridding.fill_voids), in time proportional
+    # to the grid size. Cells outside the reprojected tile footprint are
+    # exterior, with no points to interpolate from, and are not filled
+    n_empty = int(np.isnan(grid).sum())
 
     if n_empty > 0:
-        logger.info(f"  Gap filling {n_empty:,} empty cells (IDW k={IDW_NEIGHBORS})...")
-
-        filled_rows, filled_cols = np.where(~empty_mask)
-        filled_z = grid[filled_rows, filled_cols]
-        empty_rows, empty_cols = np.where(empty_mask)
-
-        filled_xy = np.column_stack([filled_cols, filled_rows])
-        empty_xy  = np.column_stack([empty_cols,  empty_rows])
-
-        tree = cKDTree(filled_xy)
-        distances, indices = tree.query(empty_xy, k=IDW_NEIGHBORS, workers=-1)
-
-        distances = np.where(distances == 0, 1e-10, distances)
-        weights   = 1.0 / (distances ** IDW_POWER)
-        weights  /= weights.sum(axis=1, keepdims=True)
-
-        grid[empty_rows, empty_cols] = (weights * filled_z[indices]).sum(axis=1)
+        max_cells = FILL_MAX_DISTANCE / RESOLUTION if FILL_MAX_DISTANCE is not None else np.inf
+        logger.info(f"  Void filling {n_empty:,} empty cells (push-pull, max {FILL_MAX_DISTANCE} m)...")
+        inside = polygon_mask(*footprint, x_min, y_max, RESOLUTION, shape)
+        grid = fill_voids(grid, max_cells, inside)
+        logger.info(f"  Filled {n_empty - int(np.isnan(grid).sum()):,}; the rest left as NoData")
 
     # Replace any remaining NaN with NoData
     grid = np.where(np.isnan(grid), NODATA_VALUE, grid).astype(np.float32)
@@ -155,20 +270,28 @@ def las_to_dem(las_path: Path, out_path: Path, logger: logging.Logger) -> None:
     crs       = CRS.from_epsg(int(OUTPUT_CRS.split(":")[1]))
     transform = from_bounds(x_min, y_min, x_max, y_max, ncols, nrows)
 
-    with rasterio.open(
-        str(out_path),
-        "w",
-        driver="GTiff",
-        height=nrows,
-        width=ncols,
-        count=1,
-        dtype="float32",
-        crs=crs,
-        transform=transform,
-        nodata=NODATA_VALUE,
-        compress="deflate"
-    ) as dst:
-        dst.write(grid, 1)
+    # Written under a temporary name and renamed into place when complete,
+    # so an interrupted write never looks like a finished tile on re-run
+    tmp_path = out_path.with_name(out_path.name + ".part")
+    try:
+        with rasterio.open(
+            str(tmp_path),
+            "w",
+            driver="GTiff",
+            height=nrows,
+            width=ncols,
+            count=1,
+            dtype="float32",
+            crs=crs,
+            transform=transform,
+            nodata=NODATA_VALUE,
+            compress="deflate"
+        ) as dst:
+            dst.write(grid, 1)
+        os.replace(tmp_path, out_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
 
     size_mb = out_path.stat().st_size / 1024 / 1024
     logger.info(f"  Written: {out_path.name}  ({size_mb:.1f} MB)")
@@ -189,49 +312,97 @@ def main():
 
     total = len(las_files)
     logger.info(f"Found {total} files")
+
+    # Finished tiles are skipped, so an interrupted run resumes where it stopped
+    pending, skipped = [], 0
+    for las_path in las_files:
+        if (output_dir / (las_path.stem + ".tif")).exists():
+            skipped += 1
+            logger.info(f"[{skipped:4d}/{total}] SKIP  {las_path.name} — already exists")
+        else:
+            pending.append(las_path)
+
+    # Tile sizes (estimated points) from the download tile plan, so the ETA
+    # weighs dense and sparse tiles by their size; equal weights otherwise
+    weights = tile_plan.tile_points(config.TILE_PLAN)
+    if not all(las_path.stem in weights for las_path in pending):
+        weights = {las_path.stem: 1 for las_path in pending}
+    total_weight = sum(max(weights[las_path.stem], 1) for las_path in pending)
+
+    # Largest tiles first, one worker per core; the scheduler only starts a
+    # tile while the estimated memory of the running tiles plus its own fits
+    # (scheduler.MEMORY_FRACTION of what is available), so small tiles run
+    # side by side and huge ones wait for room
+    costs   = [tile_cost(las_path) for las_path in pending]
+    memory  = [tile_memory(las_path) for las_path in pending]
+    workers = choose_workers(len(pending), WORKERS)
+
     logger.info(f"Input dir  : {input_dir}")
     logger.info(f"Output dir : {output_dir}")
     logger.info(f"Input CRS  : {INPUT_CRS}")
     logger.info(f"Output CRS : {OUTPUT_CRS}")
     logger.info(f"Resolution : {RESOLUTION} m")
+    if GRID_ALIGN == "global":
+        logger.info(f"Grid       : global lattice, origin {GRID_ORIGIN}")
+    else:
+        logger.info("Grid       : per tile")
+    if workers > 1:
+        decoder = "Lazrs (per worker)" if laspy.LazBackend.Lazrs.is_available() else "laspy default"
+    else:
+        decoder = LAZ_BACKEND.name if LAZ_BACKEND else "laspy default"
+    logger.info(f"LAZ decoder: {decoder}")
+    logger.info(f"Workers    : {workers}  (largest tile ~{max(memory, default=0) / 1024**2:.0f} MB)")
     logger.info("-" * 60)
 
-    succeeded, failed, skipped = 0, 0, 0
+    succeeded, failed = 0, 0
     failures   = []
+    done_weight = 0
     start_time = time.time()
 
-    for i, las_path in enumerate(las_files, start=1):
-        out_path = output_dir / (las_path.stem + ".tif")
-
-        if out_path.exists():
-            skipped += 1
-            logger.info(f"[{i:4d}/{total}] SKIP  {las_path.name} — already exists")
-            continue
-
-        logger.info(f"[{i:4d}/{total}] START {las_path.name}")
-        tile_start = time.time()
-
-        try:
-            las_to_dem(las_path, out_path, logger)
-
-            succeeded += 1
-            tile_time = time.time() - tile_start
-            elapsed   = time.time() - start_time
-            eta_min   = (total - i) / (i / elapsed) / 60 if elapsed > 0 else 0
-
-            logger.info(
-                f"[{i:4d}/{total}] OK    {las_path.name}  |  "
-                f"tile: {tile_time:.1f}s  |  "
-                f"elapsed: {elapsed/60:.1f} min  |  "
-                f"ETA: {eta_min:.1f} min"
-            )
-
-        except Exception as e:
-            failed += 1
-            failures.append((las_path.name, str(e)))
-            if out_path.exists():
-                out_path.unlink()
-            logger.error(f"[{i:4d}/{total}] FAIL  {las_path.name} — {e}")
+    # One worker runs the tiles in this process; more run them in worker
+    # processes, whose log records come back through a queue and are
+    # written here by a single listener
+    listener = None
+    if workers > 1:
+        log_queue = multiprocessing.get_context("spawn").Queue()  # Same context as the pool
+        listener = logging.handlers.QueueListener(
+            log_queue, *logging.getLogger().handlers, respect_handler_level=True
+        )
+        listener.start()
+        scheduler = LargestFirstScheduler(
+            workers, processes=True, initializer=init_worker, initargs=(log_queue,)
+        )
+    else:
+        scheduler = LargestFirstScheduler(1)
+    rasterize = partial(rasterize_tile, output_dir=output_dir)
+
+    try:
+        results = scheduler.run(rasterize, pending, costs, memory)
+        for i, (las_path, tile_time, error) in enumerate(results, start=skipped + 1):
+            out_path = output_dir / (las_path.stem + ".tif")
+            done_weight += max(weights[las_path.stem], 1)
+            elapsed = time.time() - start_time
+
+            if error is None:
+                succeeded += 1
+                eta_min = (total_weight - done_weight) / (done_weight / elapsed) / 60 if elapsed > 0 else 0
+                logger.info(
+                    f"[{i:4d}/{total}] OK    {las_path.name}  |  "
+                    f"tile: {tile_time:.1f}s  |  "
+                    f"elapsed: {elapsed/60:.1f} min  |  "
+                    f"ETA: {eta_min:.1f} min"
+                )
+            else:
+                failed += 1
+                failures.append((las_path.name, str(error)))
+                # A worker that was killed mid-write leaves its partial file behind
+                for path in (out_path, out_path.with_name(out_path.name + ".part")):
+                    if path.exists():
+                        path.unlink()
+                logger.error(f"[{i:4d}/{total}] FAIL  {las_path.name} — {error}")
+    finally:
+        if listener is not None:
+            listener.stop()
 
     # Final summary
     elapsed_total = time.time() - start_time
@@ -241,6 +412,8 @@ def main():
     logger.info(f"  Skipped   : {skipped}")
     logger.info(f"  Failed    : {failed}")
     logger.info(f"  Total time: {elapsed_total / 60:.1f} minutes")
+    for line in scheduler.summary().splitlines():
+        logger.info(line)
 
     if failures:
         logger.error("Failed tiles:")
@@ -1,25 +1,38 @@
 """
 laz_to_las.py
 -------------
-Batch extracts LAZ files to LAS format using LASzip.
+Batch extracts LAZ files to LAS format, either in-process with lazrs
+(config.EXTRACT_BACKEND = "lazrs") or with LASzip.
 Outputs all LAS files to E:\LiDAR\Scoped\Extracted, creating the folder if needed.
 
+The lazrs backend extracts one file at a time, decompressing its LAZ chunks
+on all cores. The points match the source, and the header, VLRs, EVLRs and
+any padding are copied unchanged apart from the LASzip VLR (and, for COPC
+input, the COPC info VLR and hierarchy EVLR) and the fields that point to
+the data. For input other than COPC the output is the same file laspy
+writes when it reads the LAZ and saves it uncompressed.
+
 USAGE:
     1. Edit the paths and settings in the CONFIG section below.
     2. Run: python laz_to_las.py
 
 Requirements:
-    LASzip must be installed and laszip.exe must be accessible.
+    lazrs backend: conda install -c conda-forge laspy lazrs-python
+    laszip backend: LASzip must be installed and laszip.exe must be accessible.
     Download from: https://laszip.org
 """
 
 import logging
+import os
+import struct
 import subprocess
 import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
 
+import laspy
+
 # Calculate the path to the project root (one level up from scripts/)
 root_dir = Path(__file__).resolve().parent.parent
 
@@ -28,6 +41,7 @@ if str(root_dir) not in sys.path:
     sys.path.append(str(root_dir))
 
 import config
+from scheduler import LargestFirstScheduler, choose_workers, tile_cost
 
 # CONFIG 
 
@@ -35,9 +49,27 @@ import config
 INPUT_DIR   = config.DATA_RAW      # Folder containing .laz files
 OUTPUT_DIR  = config.DATA_PROCESSED       # Output folder (created if missing)
 
+BACKEND     = config.EXTRACT_BACKEND  # "lazrs" (in-process) or "laszip"
+
 LASZIP_EXE  = config.LASZIP_EXE  # Path to laszip.exe
 
-MAX_WORKERS = config.MAX_WORKERS        # Number of parallel extractions
+MAX_WORKERS = config.MAX_WORKERS        # Number of parallel extractions (laszip)
+
+POINTS_PER_READ = 5_000_000     # Points decompressed per batch (lazrs)
+
+# LAS header byte offsets (LAS 1.0-1.4)
+HEADER_SIZE_OFFSET    = 94
+POINT_OFFSET_OFFSET   = 96
+NUMBER_OF_VLRS_OFFSET = 100
+POINT_FORMAT_OFFSET   = 104
+FIRST_EVLR_OFFSET     = 235     # LAS 1.4 only
+NUMBER_OF_EVLRS_OFFSET = 243    # LAS 1.4 only
+
+VLR_HEADER_SIZE  = 54
+EVLR_HEADER_SIZE = 60
+LASZIP_VLR       = (b"laszip encoded", 22204)   # (user ID, record ID)
+COPC_INFO_VLR    = (b"copc", 1)
+COPC_HIERARCHY_EVLR = (b"copc", 1000)
 
 
 
@@ -55,9 +87,82 @@ def setup_logging(output_dir: Path) -> logging.Logger:
     return logging.getLogger(__name__)
 
 
+def lazrs_extract(laz_path: Path, out_path: Path) -> None:
+    """
+    Decompress a LAZ file to LAS in-process.
+
+    The header and VLR bytes are copied from the LAZ file minus the LASzip
+    VLR, with the compression bits of the point format cleared and the
+    point data (and EVLR) offsets moved up by the removed VLR's size.
+    For COPC input the COPC info VLR and hierarchy EVLR are dropped too:
+    their offsets describe the compressed chunks, not the LAS output.
+    Points are decompressed by lazrs in batches, each batch's LAZ chunks in
+    parallel on all cores, and EVLRs are copied after the points. The file
+    is written under a temporary name and renamed into place when complete.
+    """
+    with laspy.open(str(laz_path), laz_backend=laspy.LazBackend.LazrsParallel) as reader:
+        header = reader.header
+        with open(laz_path, "rb") as f:
+            raw = f.read(header.offset_to_point_data)
+            evlrs = []
+            if header.number_of_evlrs > 0:
+                f.seek(header.start_of_first_evlr)
+                for _ in range(header.number_of_evlrs):
+                    evlr_header = f.read(EVLR_HEADER_SIZE)
+                    user_id = evlr_header[2:18].rstrip(b"\0")
+                    (record_id,) = struct.unpack_from("<H", evlr_header, 18)
+                    (length,) = struct.unpack_from("<Q", evlr_header, 20)
+                    body = f.read(length)
+                    if (user_id, record_id) != COPC_HIERARCHY_EVLR:
+                        evlrs.append(evlr_header + body)
+
+        # --- Header and VLRs, without the LASzip and COPC VLRs ---
+        (header_size,) = struct.unpack_from("<H", raw, HEADER_SIZE_OFFSET)
+        (n_vlrs,) = struct.unpack_from("<I", raw, NUMBER_OF_VLRS_OFFSET)
+        kept = []
+        pos = header_size
+        for _ in range(n_vlrs):
+            user_id = raw[pos + 2:pos + 18].rstrip(b"\0")
+            record_id, length = struct.unpack_from("<HH", raw, pos + 18)
+            end = pos + VLR_HEADER_SIZE + length
+            if (user_id, record_id) not in (LASZIP_VLR, COPC_INFO_VLR):
+                kept.append(raw[pos:end])
+            pos = end
+        vlr_bytes = b"".join(kept) + raw[pos:]  # Keep any padding before the points
+
+        point_offset = header_size + len(vlr_bytes)
+        record_length = header.point_format.size
+        new_header = bytearray(raw[:header_size])
+        struct.pack_into("<I", new_header, POINT_OFFSET_OFFSET, point_offset)
+        struct.pack_into("<I", new_header, NUMBER_OF_VLRS_OFFSET, len(kept))
+        new_header[POINT_FORMAT_OFFSET] &= 0x3F  # Clear the LAZ compression bits
+        if header.number_of_evlrs > 0:
+            struct.pack_into("<I", new_header, NUMBER_OF_EVLRS_OFFSET, len(evlrs))
+            struct.pack_into(
+                "<Q", new_header, FIRST_EVLR_OFFSET,
+                point_offset + header.point_count * record_length if evlrs else 0
+            )
+
+        # --- Points, then EVLRs ---
+        tmp_path = out_path.with_name(out_path.name + ".part")
+        try:
+            with open(tmp_path, "wb") as dest:
+                dest.write(new_header)
+                dest.write(vlr_bytes)
+                for points in reader.chunk_iterator(POINTS_PER_READ):
+                    dest.write(points.array.tobytes())
+                for evlr in evlrs:
+                    dest.write(evlr)
+            os.replace(tmp_path, out_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+
 def extract_tile(laz_path: Path, output_dir: Path, laszip_exe: str) -> tuple[str, bool, str]:
     """
-    Extracts a single LAZ file to LAS using laszip.exe.
+    Extracts a single LAZ file to LAS with the configured backend (lazrs,
+    or laszip.exe).
     Returns (filename, success, message).
     """
     out_path = output_dir / (laz_path.stem + ".las")
@@ -67,6 +172,10 @@ def extract_tile(laz_path: Path, output_dir: Path, laszip_exe: str) -> tuple[str
         return (laz_path.name, True, "Skipped — already exists")
 
     try:
+        if BACKEND == "lazrs":
+            lazrs_extract(laz_path, out_path)
+            return (laz_path.name, True, f"OK -> {out_path.name}")
+
         cmd = [
             laszip_exe,
             "-i", str(laz_path),
@@ -103,7 +212,7 @@ def main():
     logger = setup_logging(output_dir)
 
     # Verify laszip.exe exists
-    if not Path(LASZIP_EXE).exists():
+    if BACKEND == "laszip" and not Path(LASZIP_EXE).exists():
         logger.error(f"laszip.exe not found at: {LASZIP_EXE}")
         logger.error("Download LASzip from https://laszip.org and update LASZIP_EXE in the config.")
         sys.exit(1)
@@ -118,44 +227,56 @@ def main():
     logger.info(f"Found {total} LAZ files")
     logger.info(f"Input dir  : {input_dir}")
     logger.info(f"Output dir : {output_dir}")
-    logger.info(f"LASzip exe : {LASZIP_EXE}")
-    logger.info(f"Workers    : {MAX_WORKERS}")
+    # Largest tiles first, so the run does not end on one big straggler
+    costs = [tile_cost(laz_path) for laz_path in laz_files]
+    total_cost = sum(costs)
+
+    # lazrs already spreads each file over all cores, so files go one at a
+    # time; laszip runs one subprocess per core, up to MAX_WORKERS
+    workers = choose_workers(total, MAX_WORKERS) if BACKEND == "laszip" else 1
+
+    logger.info(f"Backend    : {BACKEND}")
+    if BACKEND == "laszip":
+        logger.info(f"LASzip exe : {LASZIP_EXE}")
+    logger.info(f"Workers    : {workers}")
     logger.info("-" * 60)
 
     succeeded, failed, skipped = 0, 0, 0
     failures = []
+    done_cost = 0
     start_time = time.time()
 
-    # ThreadPoolExecutor is used here (vs ProcessPoolExecutor) because
-    # each worker is spawning an external subprocess, not running Python code
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {
-            executor.submit(extract_tile, laz_path, output_dir, LASZIP_EXE): laz_path
-            for laz_path in laz_files
-        }
-
-        for i, future in enumerate(as_completed(futures), start=1):
-            filename, success, message = future.result()
-
-            if "Skipped" in message:
-                skipped += 1
-                status = "SKIP"
-            elif success:
-                succeeded += 1
-                status = "OK  "
-            else:
-                failed += 1
-                failures.append((filename, message))
-                status = "FAIL"
-
-            elapsed = time.time() - start_time
-            rate    = i / elapsed
-            eta_min = (total - i) / rate / 60 if rate > 0 else 0
-
-            logger.info(
-                f"[{i:4d}/{total}] {status}  {filename}  |  "
-                f"{elapsed/60:.1f} min elapsed  |  ETA {eta_min:.1f} min  |  {message}"
-            )
+    # Threads rather than processes, because each worker is either
+    # spawning an external subprocess or running lazrs, which decompresses
+    # outside the GIL
+    scheduler = LargestFirstScheduler(workers)
+    extract = partial(extract_tile, output_dir=output_dir, laszip_exe=LASZIP_EXE)
+    cost_of = dict(zip(laz_files, costs))
+
+    for i, (laz_path, result, error) in enumerate(scheduler.run(extract, laz_files, costs), start=1):
+        filename, success, message = result if error is None else (laz_path.name, False, str(error))
+
+        if "Skipped" in message:
+            skipped += 1
+            status = "SKIP"
+        elif success:
+            succeeded += 1
+            status = "OK  "
+        else:
+            failed += 1
+            failures.append((filename, message))
+            status = "FAIL"
+
+        # ETA by remaining cost rather than remaining file count
+        done_cost += cost_of[laz_path]
+        elapsed = time.time() - start_time
+        rate    = done_cost / elapsed if elapsed > 0 else 0
+        eta_min = (total_cost - done_cost) / rate / 60 if rate > 0 else 0
+
+        logger.info(
+            f"[{i:4d}/{total}] {status}  {filename}  |  "
+            f"{elapsed/60:.1f} min elapsed  |  ETA {eta_min:.1f} min  |  {message}"
+        )
 
     # Final summary
     elapsed_total = time.time() - start_time
@@ -165,6 +286,8 @@ def main():
     logger.info(f"  Skipped   : {skipped}")
     logger.info(f"  Failed    : {failed}")
     logger.info(f"  Total time: {elapsed_total / 60:.1f} minutes")
+    for line in scheduler.summary().splitlines():
+        logger.info(line)
 
     if failures:
         logger.error("Failed tiles:")
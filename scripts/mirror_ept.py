@@ -0,0 +1,135 @@
+"""
+mirror_ept.py
+-------------
+Copies the part of the USGS EPT dataset covering the study area
+(BOUNDS_STR, or the AOI_PATH polygon if set) to a local directory:
+ept.json, the hierarchy pages, and every data node down to the octree
+depth for MIRROR_RES.
+
+The mirror is an EPT dataset in its own right. Point config.EPT_URL at its
+ept.json (a plain path or a file:// URL) and batchdownload.py reads it with
+the same code path, from disk instead of S3, so re-tiling runs (new
+TILE_SIZE, OVERLAP, or an AOI inside the mirrored area) never touch the
+network. Hierarchy pages are pruned to the mirrored nodes, so a query
+outside the mirrored area finds no nodes rather than missing files.
+
+The mirror is resumable: nodes already on disk are not downloaded again,
+and ept.json is written last, so a directory with an ept.json is complete.
+
+USAGE:
+    1. Edit the settings in the CONFIG section below.
+    2. Run: python mirror_ept.py
+    3. Set EPT_URL in config.py to the printed ept.json path.
+
+Requirements:
+    conda install -c conda-forge laspy lazrs-python numpy requests shapely
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Calculate the path to the project root (one level up from scripts/)
+root_dir = Path(__file__).resolve().parent.parent
+
+# Add the root directory to sys.path so Python can find config.py
+if str(root_dir) not in sys.path:
+    sys.path.append(str(root_dir))
+
+import config
+import batchdownload as bd
+
+# =============================================================================
+# CONFIG — Edit these before running
+# =============================================================================
+
+SOURCE_URL = config.EPT_URL          # Dataset to mirror
+MIRROR_DIR = config.EPT_MIRROR_DIR   # Where the mirror is written
+MIRROR_RES = config.RES              # Finest resolution to mirror (None = all depths)
+
+# =============================================================================
+# END CONFIG — No edits needed below this line
+# =============================================================================
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write a file under a temporary name and rename it into place."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def main():
+    mirror_dir = Path(MIRROR_DIR)
+    mirror_ept = mirror_dir / "ept.json"
+    if bd.is_local_source(SOURCE_URL) and bd.local_path(SOURCE_URL).resolve() == mirror_ept.resolve():
+        print("ERROR: SOURCE_URL points at the mirror itself. Set it to the remote EPT dataset.")
+        sys.exit(1)
+
+    # The mirror itself is the cache; don't store every node twice
+    config.NODE_CACHE_MAX_GB = 0
+
+    print(f"Source : {SOURCE_URL}")
+    print(f"Mirror : {mirror_dir}")
+    ept_info = bd.fetch_json_cached(SOURCE_URL)
+    if ept_info is None:
+        print("ERROR: ept.json not found (HTTP 404). Check SOURCE_URL.")
+        sys.exit(1)
+    base_url = bd.ept_base_url(SOURCE_URL)
+
+    # --- Step 1: Plan the nodes covering the study area ---
+    study_area = bd.load_study_area()
+    max_depth = bd.depth_for_resolution(ept_info, MIRROR_RES)
+    hierarchy = bd.get_hierarchy(base_url)
+    print("Planning nodes...", end="", flush=True)
+    nodes = bd.collect_nodes(
+        hierarchy, ept_info["bounds"], study_area.bounds, base_url, max_depth,
+        bd.tile_area(study_area)
+    )
+
+    data_dir = mirror_dir / "ept-data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    missing = [key for key in nodes if not (data_dir / f"{key}.laz").exists()]
+    print(f" {len(nodes)} nodes @ {MIRROR_RES}m, {len(missing)} still to copy")
+
+    # --- Step 2: Copy data nodes ---
+    start_time = time.time()
+    n_bytes = 0
+    for n, (key, raw, _) in enumerate(bd.fetch_nodes(base_url, missing), start=1):
+        write_atomic(data_dir / f"{key}.laz", raw)
+        n_bytes += len(raw)
+
+        if n % 100 == 0 or n == len(missing):
+            elapsed = time.time() - start_time
+            eta_min = (len(missing) - n) / (n / elapsed) / 60 if elapsed > 0 else 0
+            print(
+                f"  [{n}/{len(missing)}] nodes | {n_bytes / 1024**3:.2f} GB | "
+                f"{elapsed/60:.1f} min elapsed | ETA {eta_min:.1f} min"
+            )
+
+    # --- Step 3: Hierarchy pages, pruned to the mirrored nodes ---
+    kept = set(nodes)
+    hierarchy_dir = mirror_dir / "ept-hierarchy"
+    hierarchy_dir.mkdir(parents=True, exist_ok=True)
+    n_pages = 0
+    for page_key, page in bd.loaded_hierarchy_pages(base_url).items():
+        if page_key != "0-0-0-0" and page_key not in kept:
+            continue
+        pruned = {key: count for key, count in page.items() if key in kept}
+        write_atomic(hierarchy_dir / f"{page_key}.json", json.dumps(pruned).encode())
+        n_pages += 1
+
+    # --- Step 4: ept.json last, marking the mirror complete ---
+    write_atomic(mirror_ept, json.dumps(ept_info).encode())
+
+    print(f"\nMirror Complete in {(time.time() - start_time)/60:.2f} minutes.")
+    print(f"  {len(nodes)} nodes, {n_pages} hierarchy pages, {n_bytes / 1024**3:.2f} GB copied")
+    print(f"  Set EPT_URL in config.py to: {mirror_ept}")
+    print(bd.get_concurrency().summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -4,25 +4,36 @@ mosaic_dem.py
 Mosaics all 274 DEM tiles (gt_*.tif) into a single seamless DEM raster
 for use as input to WhiteboxTools hydrology processing.
 
-Uses the same batch mosaicking approach as mosaic_hydrology.py to avoid
-Windows command line length limits.
+With config.DEM_GRID_ALIGN = "global" the tiles share one cell lattice, so
+the mosaic is assembled by array copy with rasterio: block by block, each
+tile's cells are copied to their lattice position, later tiles overwriting
+earlier ones where they overlap (NoData never overwrites data). Nothing is
+resampled and the result is exactly reproducible; ArcGIS is not needed.
+
+With DEM_GRID_ALIGN = "tile" (tiles on their own grids) the tiles are
+mosaicked with ArcGIS, using the same batch mosaicking approach as
+mosaic_hydrology.py to avoid Windows command line length limits.
 
 USAGE:
     1. Edit the paths in the CONFIG section below.
-    2. Run from the ArcGIS Pro Python environment:
-       conda activate arcgispro-py3
-       python mosaic_dem.py
+    2. Run: python mosaic_dem.py
+       - DEM_GRID_ALIGN = "global": from ksn_env (conda activate ksn_env)
+       - DEM_GRID_ALIGN = "tile"  : from the ArcGIS Pro Python environment
+         (conda activate arcgispro-py3)
+       run_pipeline.py picks the environment from DEM_GRID_ALIGN.
 
 Requirements:
-    - ArcGIS Pro
+    - "global": conda install -c conda-forge rasterio numpy
+    - "tile"  : ArcGIS Pro
 """
 
 import logging
 import sys
 import time
+from contextlib import ExitStack
 from pathlib import Path
 
-import arcpy
+import numpy as np
 
 # Calculate the path to the project root (one level up from scripts/)
 root_dir = Path(__file__).resolve().parent.parent
@@ -40,6 +51,8 @@ import config
 DEM_DIR    = config.DATA_SCRATCH_DEMS             # Folder containing gt_*.tif DEM tiles
 OUTPUT_DIR = config.DATA_DEM_MOSAIC               # Output folder
 OUTPUT_FILE = "dem_mosaic.tif"                    # Output mosaic filename
+GRID_ALIGN = config.DEM_GRID_ALIGN                # "global": array copy; "tile": ArcGIS
+BLOCK_SIZE = 4096                                 # Cells per side assembled at a time ("global")
 
 # =============================================================================
 # END CONFIG — No edits needed below this line
@@ -60,31 +73,112 @@ def setup_logging(output_dir: Path) -> logging.Logger:
     return logging.getLogger(__name__)
 
 
-def main():
-    dem_dir    = Path(DEM_DIR)
-    output_dir = Path(OUTPUT_DIR)
-    output_dir.mkdir(parents=True, exist_ok=True)
+def lattice_offsets(dem_files: list, logger: logging.Logger):
+    """
+    Return (row, col, height, width) of each tile, its top-left cell on
+    the first tile's lattice, or None if a tile differs in cell size or
+    CRS or is not on that lattice.
+    """
+    import rasterio
 
-    logger = setup_logging(output_dir)
+    with rasterio.open(str(dem_files[0])) as first:
+        t0, crs = first.transform, first.crs
+    res_x, res_y = t0.a, -t0.e
 
-    # Collect all DEM tiles
-    dem_files = sorted(dem_dir.glob("gt_*.tif"))
-    if not dem_files:
-        logger.error(f"No gt_*.tif files found in: {dem_dir}")
+    offsets = []
+    for path in dem_files:
+        with rasterio.open(str(path)) as src:
+            t = src.transform
+            if src.crs != crs or t.b != 0 or t.d != 0 or (t.a, -t.e) != (res_x, res_y):
+                logger.error(f"{path.name}: cell size or CRS differs from {dem_files[0].name}")
+                return None
+            col = (t.c - t0.c) / res_x
+            row = (t0.f - t.f) / res_y
+            if abs(col - round(col)) > 1e-6 or abs(row - round(row)) > 1e-6:
+                logger.error(f"{path.name}: not on the lattice of {dem_files[0].name} (offset {row:.3f}, {col:.3f} cells)")
+                return None
+            offsets.append((round(row), round(col), src.height, src.width))
+    return offsets
+
+
+def mosaic_aligned(dem_files: list, out_path: Path, logger: logging.Logger) -> None:
+    """
+    Mosaic tiles that share one cell lattice by copying their cells into
+    place, BLOCK_SIZE x BLOCK_SIZE output cells at a time, in file order
+    (later tiles win where both have data). Written under a temporary name
+    and renamed when complete.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    offsets = lattice_offsets(dem_files, logger)
+    if offsets is None:
+        logger.error("DEM tiles are not on a common lattice. Re-run las_to_dem.py with "
+                     "DEM_GRID_ALIGN = \"global\", or set DEM_GRID_ALIGN = \"tile\" to mosaic with ArcGIS.")
         sys.exit(1)
 
-    total    = len(dem_files)
-    out_path = output_dir / OUTPUT_FILE
+    with rasterio.open(str(dem_files[0])) as first:
+        profile = first.profile
+        t0 = first.transform
+    nodata = profile["nodata"]
 
-    logger.info(f"Found {total} DEM tiles")
-    logger.info(f"Input dir  : {dem_dir}")
-    logger.info(f"Output dir : {output_dir}")
-    logger.info(f"Output file: {OUTPUT_FILE}")
-    logger.info("-" * 60)
+    # Mosaic extent on the lattice, in cells relative to the first tile
+    row0 = min(r for r, c, h, w in offsets)
+    col0 = min(c for r, c, h, w in offsets)
+    height = max(r + h for r, c, h, w in offsets) - row0
+    width  = max(c + w for r, c, h, w in offsets) - col0
+    transform = t0 * rasterio.Affine.translation(col0, row0)
+    logger.info(f"Mosaic     : {height} x {width} cells, array copy (no resampling)")
 
-    if out_path.exists():
-        logger.info(f"Output already exists — skipping: {out_path.name}")
-        sys.exit(0)
+    profile.update(
+        driver="GTiff", height=height, width=width, count=1, dtype="float32",
+        transform=transform, compress="deflate", tiled=True,
+        blockxsize=512, blockysize=512, BIGTIFF="IF_SAFER"
+    )
+
+    # Tiles as (top row, left col, bottom row, right col) in mosaic cells
+    extents = [(r - row0, c - col0, r - row0 + h, c - col0 + w) for r, c, h, w in offsets]
+    block_rows = range(0, height, BLOCK_SIZE)
+    start_time = time.time()
+
+    tmp_path = out_path.with_name(out_path.name + ".part")
+    with ExitStack() as stack:
+        tiles = [stack.enter_context(rasterio.open(str(path))) for path in dem_files]
+        dst = stack.enter_context(rasterio.open(str(tmp_path), "w", **profile))
+
+        for b, r0 in enumerate(block_rows, start=1):
+            r1 = min(r0 + BLOCK_SIZE, height)
+            for c0 in range(0, width, BLOCK_SIZE):
+                c1 = min(c0 + BLOCK_SIZE, width)
+                block = np.full((r1 - r0, c1 - c0), nodata, dtype=np.float32)
+
+                for src, (tr0, tc0, tr1, tc1) in zip(tiles, extents):
+                    top, left = max(r0, tr0), max(c0, tc0)
+                    bottom, right = min(r1, tr1), min(c1, tc1)
+                    if top >= bottom or left >= right:
+                        continue
+                    cells = src.read(1, window=Window(left - tc0, top - tr0, right - left, bottom - top))
+                    target = block[top - r0:bottom - r0, left - c0:right - c0]
+                    valid = cells != src.nodata if src.nodata is not None else np.ones(cells.shape, bool)
+                    valid &= ~np.isnan(cells)
+                    target[valid] = cells[valid]
+
+                dst.write(block, 1, window=Window(c0, r0, c1 - c0, r1 - r0))
+
+            elapsed = time.time() - start_time
+            rate    = b / elapsed if elapsed > 0 else 0
+            eta_min = (len(block_rows) - b) / rate / 60 if rate > 0 else 0
+            logger.info(f"Block row {b}/{len(block_rows)} | elapsed: {elapsed/60:.1f} min | ETA: {eta_min:.1f} min")
+
+    tmp_path.replace(out_path)
+
+
+def mosaic_arcpy(dem_files: list, out_path: Path, logger: logging.Logger) -> None:
+    """Mosaic tiles on their own grids with ArcGIS (resampled to the first tile's cell size)."""
+    import arcpy
+
+    total      = len(dem_files)
+    output_dir = out_path.parent
 
     # Get spatial reference and cell size from first tile
     desc      = arcpy.Describe(str(dem_files[0]))
@@ -131,6 +225,39 @@ def main():
         eta_min  = (len(batches) - b) / rate / 60 if rate > 0 else 0
         logger.info(f"Batch {b} complete | elapsed: {elapsed/60:.1f} min | ETA: {eta_min:.1f} min")
 
+
+def main():
+    dem_dir    = Path(DEM_DIR)
+    output_dir = Path(OUTPUT_DIR)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    logger = setup_logging(output_dir)
+
+    # Collect all DEM tiles
+    dem_files = sorted(dem_dir.glob("gt_*.tif"))
+    if not dem_files:
+        logger.error(f"No gt_*.tif files found in: {dem_dir}")
+        sys.exit(1)
+
+    total    = len(dem_files)
+    out_path = output_dir / OUTPUT_FILE
+
+    logger.info(f"Found {total} DEM tiles")
+    logger.info(f"Input dir  : {dem_dir}")
+    logger.info(f"Output dir : {output_dir}")
+    logger.info(f"Output file: {OUTPUT_FILE}")
+    logger.info("-" * 60)
+
+    if out_path.exists():
+        logger.info(f"Output already exists — skipping: {out_path.name}")
+        sys.exit(0)
+
+    start_time = time.time()
+    if GRID_ALIGN == "global":
+        mosaic_aligned(dem_files, out_path, logger)
+    else:
+        mosaic_arcpy(dem_files, out_path, logger)
+
     elapsed_total = time.time() - start_time
     size_gb       = out_path.stat().st_size / 1024 ** 3
 
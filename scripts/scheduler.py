@@ -0,0 +1,227 @@
+"""
+scheduler.py
+------------
+Largest-first work scheduler shared by the tile stages (laz_to_las.py,
+las_to_dem.py).
+
+Tiles differ a lot in size, so submitting them in name order can leave the
+biggest tile for last, with one worker busy and the rest idle. Here tasks
+are started in order of decreasing cost (points in the tile header, or file
+size), which keeps the tail of the run short. The worker count is chosen
+from the usable cores and the memory currently available, tasks with a
+memory estimate are only started while they fit in the memory budget, and
+a per-worker utilisation report is logged at the end.
+
+Usage:
+
+    costs = [tile_cost(path) for path in paths]
+    workers = choose_workers(len(paths), max_workers, task_memory)
+    scheduler = LargestFirstScheduler(workers)
+    for path, result, error in scheduler.run(fn, paths, costs, task_memory):
+        ...
+    logger.info(scheduler.summary())
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import laspy
+
+# Share of the currently available memory the workers may use together
+MEMORY_FRACTION = 0.8
+
+
+def tile_cost(path) -> int:
+    """
+    Estimated cost of processing a LAS/LAZ tile: its point count from the
+    header, or the file size in bytes if the header cannot be read.
+    """
+    try:
+        with laspy.open(str(path)) as reader:
+            return int(reader.header.point_count)
+    except Exception:
+        return Path(path).stat().st_size
+
+
+def usable_cores() -> int:
+    """CPU cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on Windows/macOS
+        return os.cpu_count() or 1
+
+
+def available_memory():
+    """Bytes of memory available for new work, or None if unknown."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        return None
+
+
+def memory_budget():
+    """Bytes the workers may use together, or None if unknown."""
+    memory = available_memory()
+    return None if memory is None else memory * MEMORY_FRACTION
+
+
+def choose_workers(n_tasks: int, max_workers: int = None, task_memory: list = None) -> int:
+    """
+    Number of workers for n_tasks: one per usable core, capped by
+    max_workers and by how many of the largest tasks (task_memory, peak
+    bytes per task) fit in MEMORY_FRACTION of the available memory. Always
+    at least one.
+    """
+    workers = min(usable_cores(), n_tasks)
+    if max_workers:
+        workers = min(workers, max_workers)
+
+    budget = memory_budget()
+    if task_memory and budget is not None:
+        largest = sorted(task_memory, reverse=True)
+        fit = 0
+        while fit < len(largest) and sum(largest[:fit + 1]) <= budget:
+            fit += 1
+        workers = min(workers, fit)
+
+    return max(1, workers)
+
+
+def _timed_call(fn, item) -> tuple:
+    """Run fn(item) and return (worker id, start, end, result, error)."""
+    worker = f"{os.getpid()}:{threading.get_ident()}"
+    start = time.time()
+    try:
+        result, error = fn(item), None
+    except Exception as e:
+        result, error = None, e
+    return worker, start, time.time(), result, error
+
+
+class LargestFirstScheduler:
+    """
+    Runs fn over items on a thread or process pool, most expensive first,
+    and records how long each worker was busy.
+
+    Threads suit work that releases the GIL (subprocesses, lazrs, numpy);
+    processes suit pure-Python work, with fn and the items picklable.
+    Worker processes are spawned rather than forked, so the caller may
+    already be running threads (e.g. a logging QueueListener).
+    initializer(*initargs) runs once in each worker process (e.g. to set up
+    logging).
+    """
+
+    def __init__(self, workers: int, processes: bool = False, initializer=None, initargs: tuple = ()):
+        self.workers = workers
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.busy = {}    # worker id -> busy seconds
+        self.tasks = {}   # worker id -> tasks run
+        self.wall = 0.0
+        self.held_back = set()  # indices of tasks that had to wait for memory
+
+    def run(self, fn, items: list, costs: list, task_memory: list = None):
+        """
+        Yield (item, result, error) as tasks finish; error is the exception
+        fn raised, or None.
+
+        Tasks are started in decreasing order of cost, at most one per
+        worker. With task_memory (estimated peak bytes per task), a task
+        is only started while the running tasks' estimates plus its own
+        fit in memory_budget(); smaller tasks that fit go ahead of it, and
+        a task always starts when nothing else is running.
+
+        If a worker process dies (e.g. killed by the OOM killer) the pool
+        can run nothing more: the task it was running, the other tasks in
+        flight and the tasks not yet started are all yielded as failed
+        with the BrokenProcessPool error, and the run ends.
+        """
+        remaining = sorted(range(len(items)), key=lambda i: costs[i], reverse=True)
+        budget = memory_budget() if task_memory else None
+        if self.processes:
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=self.initializer, initargs=self.initargs,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.workers)
+
+        start = time.time()
+        running = {}  # future -> item index
+        reserved = 0
+        broken = None
+        try:
+            with pool as executor:
+                while (remaining or running) and broken is None:
+                    # --- Admit tasks while workers and memory allow ---
+                    for i in list(remaining):
+                        if len(running) >= self.workers:
+                            break
+                        need = task_memory[i] if task_memory else 0
+                        if running and budget is not None and reserved + need > budget:
+                            self.held_back.add(i)
+                            continue
+                        try:
+                            future = executor.submit(_timed_call, fn, items[i])
+                        except BrokenProcessPool as exc:
+                            broken = exc
+                            break
+                        remaining.remove(i)
+                        reserved += need
+                        running[future] = i
+                    if broken is not None:
+                        break
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i = running.pop(future)
+                        reserved -= task_memory[i] if task_memory else 0
+                        try:
+                            worker, t0, t1, result, error = future.result()
+                        except BrokenProcessPool as exc:
+                            broken = exc
+                            yield items[i], None, exc
+                            continue
+                        self.busy[worker] = self.busy.get(worker, 0.0) + (t1 - t0)
+                        self.tasks[worker] = self.tasks.get(worker, 0) + 1
+                        yield items[i], result, error
+
+            # --- Pool broken: fail whatever was in flight or still queued ---
+            if broken is not None:
+                for i in list(running.values()) + remaining:
+                    yield items[i], None, broken
+        finally:
+            self.wall += time.time() - start
+
+    def summary(self) -> str:
+        """Per-worker utilisation: busy time as a share of the run's wall time."""
+        if not self.busy or self.wall <= 0:
+            return f"Workers: {self.workers} (no tasks run)"
+        lines = [f"Workers: {self.workers}, {self.wall / 60:.1f} min wall time"]
+        for n, worker in enumerate(sorted(self.busy, key=self.busy.get, reverse=True), start=1):
+            lines.append(
+                f"  worker {n}: {100 * self.busy[worker] / self.wall:5.1f}% busy  "
+                f"({self.tasks[worker]} tasks, {self.busy[worker] / 60:.1f} min)"
+            )
+        idle = self.workers - len(self.busy)
+        if idle > 0:
+            lines.append(f"  {idle} worker(s) never ran a task")
+        if self.held_back:
+            lines.append(f"  {len(self.held_back)} task(s) waited for memory")
+        total = sum(self.busy.values()) / (self.wall * self.workers)
+        lines.append(f"  overall: {100 * total:.1f}%")
+        return "\n".join(lines)
@@ -0,0 +1,257 @@
+"""
+tile_plan.py
+------------
+Lays out the download tiles for the study area and records them in a tile
+plan (config.TILE_PLAN) that the later stages read back.
+
+Two layouts (config.TILING):
+  - "grid"     : TILE_SIZE squares stepped by TILE_SIZE - OVERLAP
+  - "balanced" : the study area is split recursively, always across its
+                 longer side at the point-count median, until every tile
+                 core holds about TILE_TARGET_POINTS points. Dense areas
+                 end up in small tiles and sparse areas in large ones
+                 (between TILE_SIZE_MIN and TILE_SIZE_MAX). Each core is
+                 then grown by OVERLAP / 2 on every side, so neighbouring
+                 tiles overlap by OVERLAP as in the grid layout.
+
+Point counts come from the EPT hierarchy (see DensityGrid), so the whole
+plan is made before a single point is downloaded. Every tile's estimated
+point count is stored in the plan; batchdownload.py and las_to_dem.py
+weight their ETAs by it.
+
+The plan is a JSON file:
+
+    {"settings": {...}, "tiles": [{"name": "gt_001",
+                                   "bounds": [minx, miny, maxx, maxy],
+                                   "points": 1234567}, ...]}
+
+Tile bounds are in EPSG:3857. With an AOI polygon they are clipped to it
+when the tiles are downloaded.
+"""
+
+import json
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+import shapely
+
+
+class DensityGrid:
+    """
+    Point counts of the EPT nodes covering the study area, spread over a
+    regular grid of square cells.
+
+    Each node's count is shared evenly among the cells whose centres lie in
+    its footprint (or the single cell under its centre, for nodes smaller
+    than a cell). The z extent is ignored: only the map view matters for
+    tiling. Cells outside the study area polygon are zeroed, since their
+    points are never downloaded.
+    """
+
+    def __init__(self, study_area, cell_size: float, node_boxes: np.ndarray, counts: np.ndarray):
+        minx, miny, maxx, maxy = study_area.bounds
+        self.origin = (minx, miny)
+        self.cell_size = cell_size
+        n_cols = max(1, math.ceil((maxx - minx) / cell_size))
+        n_rows = max(1, math.ceil((maxy - miny) / cell_size))
+
+        # Covered cell ranges (inclusive) per node, by cell centre
+        c0 = np.ceil((node_boxes[:, 0] - minx) / cell_size - 0.5).astype(np.int64)
+        c1 = np.floor((node_boxes[:, 2] - minx) / cell_size - 0.5).astype(np.int64)
+        r0 = np.ceil((node_boxes[:, 1] - miny) / cell_size - 0.5).astype(np.int64)
+        r1 = np.floor((node_boxes[:, 3] - miny) / cell_size - 0.5).astype(np.int64)
+        small_x = c1 < c0
+        c0[small_x] = c1[small_x] = np.floor(
+            ((node_boxes[small_x, 0] + node_boxes[small_x, 2]) / 2 - minx) / cell_size
+        ).astype(np.int64)
+        small_y = r1 < r0
+        r0[small_y] = r1[small_y] = np.floor(
+            ((node_boxes[small_y, 1] + node_boxes[small_y, 3]) / 2 - miny) / cell_size
+        ).astype(np.int64)
+        per_cell = counts / ((c1 - c0 + 1) * (r1 - r0 + 1))
+
+        # Only the part of each footprint inside the grid
+        c0, c1 = np.clip(c0, 0, n_cols), np.clip(c1, -1, n_cols - 1)
+        r0, r1 = np.clip(r0, 0, n_rows), np.clip(r1, -1, n_rows - 1)
+        inside = (c0 <= c1) & (r0 <= r1)
+        c0, c1, r0, r1, per_cell = c0[inside], c1[inside], r0[inside], r1[inside], per_cell[inside]
+
+        # Add each footprint as a rectangle: +v/-v at its corners in a
+        # difference array, then a 2-D cumulative sum
+        width = n_cols + 1
+        corners = np.concatenate([r0 * width + c0, r0 * width + c1 + 1,
+                                  (r1 + 1) * width + c0, (r1 + 1) * width + c1 + 1])
+        weights = np.concatenate([per_cell, -per_cell, -per_cell, per_cell])
+        diff = np.bincount(corners, weights, minlength=(n_rows + 1) * width)
+        values = diff.reshape(n_rows + 1, width).cumsum(axis=0).cumsum(axis=1)[:n_rows, :n_cols]
+
+        xs = minx + (np.arange(n_cols) + 0.5) * cell_size
+        ys = miny + (np.arange(n_rows) + 0.5) * cell_size
+        if not study_area.equals(shapely.box(*study_area.bounds)):
+            cx, cy = np.meshgrid(xs, ys)
+            values[~shapely.contains_xy(study_area, cx, cy)] = 0.0
+
+        # Cumulative sums with a zero row and column, for box sums
+        self.values = np.maximum(values, 0.0)
+        self._table = np.zeros((n_rows + 1, n_cols + 1))
+        self._table[1:, 1:] = self.values.cumsum(axis=0).cumsum(axis=1)
+
+    @property
+    def shape(self) -> tuple:
+        return self.values.shape
+
+    def cell_sum(self, r0: int, r1: int, c0: int, c1: int) -> float:
+        """Points in cell rows r0:r1 and columns c0:c1 (half-open)."""
+        t = self._table
+        return float(t[r1, c1] - t[r0, c1] - t[r1, c0] + t[r0, c0])
+
+    def box_sum(self, bounds: tuple) -> float:
+        """Points in the cells whose centres lie in a (minx, miny, maxx, maxy) box."""
+        ox, oy = self.origin
+        n_rows, n_cols = self.shape
+        c0 = min(max(math.ceil((bounds[0] - ox) / self.cell_size - 0.5), 0), n_cols)
+        c1 = min(max(math.ceil((bounds[2] - ox) / self.cell_size - 0.5), 0), n_cols)
+        r0 = min(max(math.ceil((bounds[1] - oy) / self.cell_size - 0.5), 0), n_rows)
+        r1 = min(max(math.ceil((bounds[3] - oy) / self.cell_size - 0.5), 0), n_rows)
+        if c1 <= c0 or r1 <= r0:
+            return 0.0
+        return self.cell_sum(r0, r1, c0, c1)
+
+
+def grid_tiles(study_area, tile_size: float, overlap: float) -> list:
+    """
+    Fixed-size tile boxes (minx, miny, maxx, maxy) over the study area's
+    extent, stepped by tile_size - overlap, column by column. Tiles that
+    miss the study area are left out.
+    """
+    minx, miny, maxx, maxy = study_area.bounds
+    step = tile_size - overlap
+    tiles = []
+
+    x = minx
+    while x < maxx:
+        y = miny
+        while y < maxy:
+            tile = (x, y, x + tile_size, y + tile_size)
+            if study_area.intersection(shapely.box(*tile)).area > 0:
+                tiles.append(tile)
+            y += step
+        x += step
+    return tiles
+
+
+def balanced_tiles(
+    study_area,
+    density: DensityGrid,
+    target_points: float,
+    min_size: float,
+    max_size: float,
+    overlap: float
+) -> list:
+    """
+    Density-balanced tile boxes (minx, miny, maxx, maxy) over the study area.
+
+    A region holding n times target_points is cut across its longer side
+    into parts holding floor(n/2) and ceil(n/2) shares, at the cell column
+    or row where the running count crosses that fraction, and each part is
+    cut again until it holds at most one share and no side exceeds
+    max_size. No cut leaves a side shorter than min_size. Cores are cell
+    aligned, clipped to the study area's extent and grown by overlap / 2;
+    cores with no points (e.g. outside an AOI polygon) are dropped. Tiles
+    come out column by column, west to east, like grid_tiles.
+    """
+    n_rows, n_cols = density.shape
+    cell = density.cell_size
+    min_cells = max(1, math.ceil(min_size / cell))
+    max_cells = max(min_cells, math.floor(max_size / cell))
+
+    cores = []
+    stack = [(0, n_rows, 0, n_cols)]
+    while stack:
+        r0, r1, c0, c1 = stack.pop()
+        total = density.cell_sum(r0, r1, c0, c1)
+        shares = max(1, math.ceil(total / target_points))
+        if shares == 1 and r1 - r0 <= max_cells and c1 - c0 <= max_cells:
+            cores.append((r0, r1, c0, c1))
+            continue
+        shares = max(shares, 2)
+
+        # Cut across the longer side if it is long enough, else the shorter
+        for axis in sorted((0, 1), key=lambda a: -(r1 - r0, c1 - c0)[a]):
+            length = (r1 - r0, c1 - c0)[axis]
+            if length < 2 * min_cells:
+                continue
+            block = density.values[r0:r1, c0:c1]
+            running = np.cumsum(block.sum(axis=1 - axis))
+            if total > 0:
+                cut = int(np.searchsorted(running, total * (shares // 2) / shares)) + 1
+            else:
+                cut = length // 2
+            cut = min(max(cut, min_cells), length - min_cells)
+            if axis == 0:
+                stack += [(r0, r0 + cut, c0, c1), (r0 + cut, r1, c0, c1)]
+            else:
+                stack += [(r0, r1, c0, c0 + cut), (r0, r1, c0 + cut, c1)]
+            break
+        else:
+            cores.append((r0, r1, c0, c1))
+
+    minx, miny, maxx, maxy = study_area.bounds
+    ox, oy = density.origin
+    margin = overlap / 2
+    tiles = []
+    for r0, r1, c0, c1 in sorted(cores, key=lambda core: (core[2], core[0])):
+        if density.cell_sum(r0, r1, c0, c1) <= 0:
+            continue
+        tiles.append((
+            ox + c0 * cell - margin,
+            oy + r0 * cell - margin,
+            min(ox + c1 * cell, maxx) + margin,
+            min(oy + r1 * cell, maxy) + margin,
+        ))
+    return tiles
+
+
+def tile_names(n_tiles: int) -> list:
+    """Output names (without extension) of the tiles in a plan."""
+    return [f"gt_{i+1:03}" for i in range(n_tiles)]
+
+
+def save_plan(path, settings: dict, tiles: list, points: list) -> None:
+    """Write a tile plan, replacing any previous plan atomically."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    plan = {
+        "settings": settings,
+        "tiles": [
+            {"name": name, "bounds": [float(v) for v in bounds], "points": int(round(n))}
+            for name, bounds, n in zip(tile_names(len(tiles)), tiles, points)
+        ]
+    }
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(plan, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_plan(path, settings: dict = None):
+    """
+    Return the tile entries of a saved plan, or None if there is no plan
+    or it was made with different settings.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        plan = json.load(f)
+    if settings is not None and plan.get("settings") != settings:
+        return None
+    return plan["tiles"]
+
+
+def tile_points(path) -> dict:
+    """{tile name: estimated points} from a saved plan ({} if there is none)."""
+    tiles = load_plan(path)
+    return {tile["name"]: tile["points"] for tile in tiles or []}